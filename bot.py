@@ -1,21 +1,70 @@
 import os
-import shutil
+import json
+import time
+import uuid
+import asyncio
+import datetime
 import tempfile
 import platform
+import functools
+import contextlib
+import multiprocessing
 from collections import namedtuple
+from typing import Awaitable, Callable, TypeVar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import aiohttp
 import asyncpg
+import aiofiles
 import disnake
+import numpy as np
 from disnake.ext import commands
 from loguru import logger
-from gradio_client import Client
 
 import utils
-from helpers import ImageProcessor, VideoProcessor
+from database import IndexEntry, MatchCheck, QueuedAttachment, Record, ScrubJob
+from helpers import (
+    AttachmentJob,
+    CircuitBreaker,
+    FlorenceClient,
+    HashIndex,
+    IngestionPipeline,
+    IngestionScheduler,
+    MediaAnalysis,
+    MediaCache,
+    PipelineStats,
+    SearchCache,
+    Transcription,
+    WatermarkTracker,
+    analyze_image,
+    analyze_video,
+    extract_image_text,
+    init_analysis_worker,
+    transcribe_video,
+)
+from helpers.transcriber import preload_model
 
 VERSION = "1.2.1"
 
+REPOST_EMOJI = "<:REPOST:1212160642002194472>"
+
+# Postgres only runs `init-scripts/` when it creates an empty database, so
+# these idempotent scripts are also applied at every startup, which creates
+# the tables added since the database was created
+SCHEMA_SCRIPTS = (
+    "4-init-media-analysis-cache.sql",
+    "5-init-channel-watermarks.sql",
+    "6-init-scrub-jobs.sql",
+    "7-init-ingestion-jobs.sql",
+)
+SCHEMA_SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), "init-scripts")
+
+# Bump when a change to the analysis makes cached results stale
+ANALYSIS_VERSION = 1
+
+RecordT = TypeVar("RecordT", bound=Record)
+
 Config = namedtuple(
     "Config",
     [
@@ -27,7 +76,46 @@ Config = namedtuple(
         "MONITORED_CHANNELS",
         "DATABASE_URI",
         "TESSERACT_CMD",
+        "OCR_BACKEND",
+        "TEXT_DETECTION_MIN_REGIONS",
+        "TEXT_DETECTION_MAX_HEIGHT",
         "PREFER_FLORENCE_2",
+        "FLORENCE_2_ENDPOINT",
+        "FLORENCE_2_MAX_CONCURRENCY",
+        "FLORENCE_2_TIMEOUT",
+        "FLORENCE_2_FAILURE_THRESHOLD",
+        "FLORENCE_2_RECOVERY_TIME",
+        "FLORENCE_2_RACE",
+        "ANALYSIS_WORKERS",
+        "ANALYSIS_TIMEOUT",
+        "WHISPER_MODEL",
+        "WHISPER_MAX_CONCURRENCY",
+        "WHISPER_PRELOAD",
+        "ANALYSIS_CACHE_MAX_AGE_DAYS",
+        "ANALYSIS_CACHE_MAX_ENTRIES",
+        "SCRUB_DOWNLOAD_WORKERS",
+        "SCRUB_ANALYSIS_WORKERS",
+        "SCRUB_QUEUE_SIZE",
+        "SCRUB_BATCH_SIZE",
+        "SCRUB_FLUSH_INTERVAL",
+        "CATCH_UP_WORKERS",
+        "IN_MEMORY_MAX_BYTES",
+        "MEDIA_CACHE_MAX_BYTES",
+        "SEARCH_RESULT_LIMIT",
+        "SEARCH_CACHE_MAX_ENTRIES",
+        "SEARCH_CACHE_TTL",
+        "VIDEO_SINGLE_PASS",
+        "VIDEO_SAMPLE_FPS",
+        "VIDEO_FRAME_SIZE",
+        "VIDEO_OCR",
+        "VIDEO_OCR_TIME_BUDGET",
+        "INGESTION_QUEUE",
+        "INGESTION_WORKER_CONCURRENCY",
+        "INGESTION_MAX_ATTEMPTS",
+        "INGESTION_LOCK_TIMEOUT",
+        "CATCH_UP_MAX_IN_FLIGHT",
+        "SCRUB_MAX_IN_FLIGHT",
+        "MESSAGE_ATTACHMENT_CONCURRENCY",
     ],
 )
 
@@ -35,24 +123,165 @@ Config = namedtuple(
 class SauronBot(commands.InteractionBot):
     def __init__(self, *args, **kwargs):
         self.config: Config = kwargs.pop("config", None)
+        # Every process needs a temp directory of its own, since its media
+        # cache keeps its own byte budget and pins
+        self.temp_dir_name: str = kwargs.pop("temp_dir_name", "tmp-sauron-bot")
         self.version = VERSION
         super().__init__(*args, **kwargs)
         self.activity = disnake.Activity(type=disnake.ActivityType.watching, name="you")
+        self.analysis_cache_hits = 0
+        self.analysis_cache_misses = 0
+        self.hash_index = HashIndex()
+
+        # The duration of every startup phase, reported once the bot is ready
+        self.startup_timings: dict[str, float] = {}
+        self.gateway_started_at: float | None = None
+
+        # Channels whose backlog has been ingested since startup. Only these
+        # advance their watermark on new messages, so a gap is never skipped.
+        self.caught_up_channels: set[int] = set()
+        # The live messages being ingested, which a watermark can't pass
+        self.live_watermarks = WatermarkTracker()
+
+        # The callbacks of every channel listened to for notifications, which
+        # are registered again whenever the listener connection is replaced
+        self.notification_listeners: dict[str, Callable] = {}
+        self.listener_task: asyncio.Task | None = None
+
+        # The tasks of the scrubs running in this process, by job identifier
+        self.scrub_tasks: dict[int, asyncio.Task] = {}
+
+        # Tesseract jobs that lost an OCR race to Florence-2 but are still
+        # running in the process pool, and so still hold their analysis slot
+        self.ocr_race_losers: set[asyncio.Task] = set()
+        self.search_cache = SearchCache(
+            self.config.SEARCH_CACHE_MAX_ENTRIES, self.config.SEARCH_CACHE_TTL
+        )
 
     async def setup_hook(self):
+        # With the ingestion queue, the workers ingest every attachment
+        await self.setup_ingestion(ingest=not self.config.INGESTION_QUEUE)
+
+        # Load cogs
+        with self.startup_phase("cog load"):
+            for extension in utils.get_cog_names():
+                try:
+                    self.load_extension(extension)
+                    logger.debug(f"Loaded extension '{extension}'")
+                except Exception as e:
+                    exception = f"{type(e).__name__}: {e}"
+                    logger.exception(
+                        f"Failed to load extension {extension}!\t{exception}"
+                    )
+
+        # Create the global bot settings entry if it doesn't exist
+        await self.create_settings_entry()
+
+        # Report the matches found by ingestion workers for live messages
+        if self.config.INGESTION_QUEUE:
+            await self.add_notification_listener(
+                "ingestion_results", self.on_ingestion_result
+            )
+            logger.info("Ingesting attachments through the ingestion queue.")
+
+        self.gateway_started_at = time.perf_counter()
+
+    @contextlib.contextmanager
+    def startup_phase(self, name: str):
+        """Time a phase of the startup, for the report logged once the bot is ready."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = time.perf_counter() - start
+
+    def report_startup_timings(self) -> None:
+        phases = " | ".join(
+            f"{name}: {secs:.2f}s" for name, secs in self.startup_timings.items()
+        )
+        total = sum(self.startup_timings.values())
+        logger.info(f"Started up in {total:.2f}s ({phases})")
+
+    async def setup_ingestion(self, ingest: bool = True):
+        """Set up everything needed to ingest attachments, but not the gateway.
+
+        Ingestion workers (see `worker.py`) only call this. Without `ingest`,
+        only what the commands need is set up: a single analysis worker
+        to hash searched images, and no transcription workers.
+        """
+        with self.startup_phase("process pools"):
+            self.create_worker_pools(ingest)
+
+        with self.startup_phase("database pool"):
+            await self.create_database_pool()
+
+        # Load every hash into the in-memory near-duplicate index
+        with self.startup_phase("hash index"):
+            await self.load_hash_index()
+        logger.debug(f"Loaded {len(self.hash_index)} hashes into the hash index")
+
+        # Initialize aiohttp session
+        with self.startup_phase("session"):
+            self.session = aiohttp.ClientSession(loop=self.loop)
+
+        # Initialize the Florence-2 OCR client. Nothing is sent to the
+        # endpoint until the first image is OCR'd.
+        self.florence = None
+        if self.config.PREFER_FLORENCE_2 and not self.config.FLORENCE_2_ENDPOINT:
+            logger.warning("PREFER_FLORENCE_2 is set without FLORENCE_2_ENDPOINT.")
+        elif self.config.PREFER_FLORENCE_2:
+            self.florence = FlorenceClient(
+                self.session,
+                self.config.FLORENCE_2_ENDPOINT,
+                self.config.FLORENCE_2_MAX_CONCURRENCY,
+                self.config.FLORENCE_2_TIMEOUT,
+                CircuitBreaker(
+                    self.config.FLORENCE_2_FAILURE_THRESHOLD,
+                    self.config.FLORENCE_2_RECOVERY_TIME,
+                ),
+            )
+            logger.debug(
+                f"Using Florence-2 for OCR at {self.config.FLORENCE_2_ENDPOINT}"
+            )
+
+    def create_worker_pools(self, ingest: bool = True):
         # Initialize temporary directory
         self.create_temp_dir()
         logger.debug(f"Initialized temp directory {self.temp_dir}")
+        logger.debug(f"Initialized media cache: {self.media_cache}")
 
-        # Load cogs
-        for extension in utils.get_cog_names():
-            try:
-                self.load_extension(extension)
-                logger.debug(f"Loaded extension '{extension}'")
-            except Exception as e:
-                exception = f"{type(e).__name__}: {e}"
-                logger.exception(f"Failed to load extension {extension}!\t{exception}")
+        # Initialize the process pool used for media analysis. Its workers are
+        # shared between live messages, catch-ups and scrubs by priority.
+        caps = {
+            "catch_up": self.config.CATCH_UP_MAX_IN_FLIGHT,
+            "scrub": self.config.SCRUB_MAX_IN_FLIGHT,
+        }
+        self.analysis_workers = self.config.ANALYSIS_WORKERS or os.cpu_count() or 1
+        if not ingest:
+            self.analysis_workers = 1
+        self.create_process_pool()
+        self.analysis_scheduler = IngestionScheduler(self.analysis_workers, caps)
+        logger.debug(
+            f"Initialized analysis process pool with {self.analysis_workers} workers"
+        )
 
+        # Initialize the long-lived Whisper transcription workers
+        self.transcription_pool = self.transcription_scheduler = None
+        if not ingest:
+            return
+        self.create_transcription_pool()
+        self.transcription_scheduler = IngestionScheduler(
+            self.config.WHISPER_MAX_CONCURRENCY, caps
+        )
+        logger.debug(
+            f"Initialized transcription process pool with {self.config.WHISPER_MAX_CONCURRENCY} workers"
+        )
+        if self.config.WHISPER_MAX_CONCURRENCY == 1:
+            logger.info(
+                "With WHISPER_MAX_CONCURRENCY=1, live videos wait for any catch-up or scrub transcription in progress."
+            )
+
+    async def create_database_pool(self):
         # Initialize database connection pool
         self.pool = await asyncpg.create_pool(
             dsn=self.config.DATABASE_URI, loop=self.loop, command_timeout=60
@@ -61,15 +290,105 @@ class SauronBot(commands.InteractionBot):
             logger.warning("Running in test mode. Using test database.")
         else:
             logger.success("Connected to database.")
+        await self.apply_schema_scripts()
 
-        # Create the global bot settings entry if it doesn't exist
-        await self.create_settings_entry()
+        # Records may be written by other processes (e.g. ingestion workers),
+        # so listen for changes on a dedicated connection to keep the index
+        # in sync. Listeners are registered before the index is loaded so
+        # that no change is missed in between.
+        self.notification_listeners["media_fingerprints"] = self.on_record_change
+        await self.connect_listener()
 
-        # Initialize aiohttp session
-        self.session = aiohttp.ClientSession(loop=self.loop)
+    async def connect_listener(self):
+        """Open the connection that receives notifications, and listen on every channel."""
+        listener = await asyncpg.connect(dsn=self.config.DATABASE_URI)
+        try:
+            for channel, callback in self.notification_listeners.items():
+                await listener.add_listener(channel, callback)
+        except BaseException:
+            await listener.close()
+            raise
+        listener.add_termination_listener(self.on_listener_terminated)
+        self.listener = listener
 
-        # Create a Gradio client for Florence-2 OCR
-        self.florence_client = Client("gokaygokay/Florence-2", verbose=False)
+    async def close_listener(self):
+        # Closing the connection on purpose must not reconnect it
+        self.listener.remove_termination_listener(self.on_listener_terminated)
+        if not self.listener.is_closed():
+            await self.listener.close()
+
+    async def add_notification_listener(self, channel: str, callback: Callable):
+        self.notification_listeners[channel] = callback
+        await self.listener.add_listener(channel, callback)
+
+    async def remove_notification_listener(self, channel: str, callback: Callable):
+        self.notification_listeners.pop(channel, None)
+        if not self.listener.is_closed():
+            await self.listener.remove_listener(channel, callback)
+
+    def on_listener_terminated(self, connection):
+        logger.error("Lost the database notification connection. Reconnecting...")
+        disconnected_at = datetime.datetime.now(datetime.timezone.utc)
+        self.listener_task = asyncio.create_task(
+            self.reconnect_listener(disconnected_at)
+        )
+
+    async def reconnect_listener(self, disconnected_at: datetime.datetime):
+        """Reconnect the listener, and catch up on the notifications it missed."""
+        delay = 1.0
+        while True:
+            try:
+                await self.connect_listener()
+                # Records may have changed while nothing was listening
+                await self.load_hash_index()
+                break
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                await self.close_listener()
+                logger.warning(
+                    f"Couldn't reconnect the notification connection, retrying in {delay:.0f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, 60.0)
+        self.search_cache.clear()
+        logger.success(
+            f"Reconnected the notification connection, reloaded {len(self.hash_index)} hashes."
+        )
+
+        if "ingestion_results" in self.notification_listeners:
+            await self.react_to_missed_results(disconnected_at)
+
+    async def react_to_missed_results(self, since: datetime.datetime) -> None:
+        """React to the live reposts found while the listener was disconnected."""
+        query = """
+            SELECT channel_id, message_id
+            FROM ingestion_jobs
+            WHERE kind = 'live'
+            AND status = 'done'
+            AND finished_at >= $1
+            AND cardinality(matches) > 0;
+        """
+        for result in await self.execute_query(query, since):
+            try:
+                await self.add_repost_reaction(
+                    result["channel_id"], result["message_id"]
+                )
+            except disnake.HTTPException as e:
+                logger.error(f"Failed to react to message {result['message_id']}: {e}")
+
+    async def apply_schema_scripts(self):
+        """Create the tables, indexes and triggers that don't exist yet."""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                # The bot and its ingestion workers may start at the same time
+                await connection.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext('sauron-bot schema'))"
+                )
+                for name in SCHEMA_SCRIPTS:
+                    async with aiofiles.open(
+                        os.path.join(SCHEMA_SCRIPTS_DIR, name)
+                    ) as f:
+                        await connection.execute(await f.read())
+        logger.debug(f"Applied {len(SCHEMA_SCRIPTS)} schema scripts")
 
     async def on_ready(self):
         # fmt: off
@@ -82,25 +401,250 @@ class SauronBot(commands.InteractionBot):
         logger.info("------")
         # fmt: on
 
+        # on_ready is also called after reconnecting, so only report once
+        if self.gateway_started_at is not None:
+            self.startup_timings["gateway ready"] = (
+                time.perf_counter() - self.gateway_started_at
+            )
+            self.gateway_started_at = None
+            self.report_startup_timings()
+
     async def close(self):
         await self.session.close()
+        if self.listener_task is not None:
+            self.listener_task.cancel()
+        await self.close_listener()
+        self.process_pool.shutdown(wait=False, cancel_futures=True)
+        if self.transcription_pool is not None:
+            self.transcription_pool.shutdown(wait=False, cancel_futures=True)
         await super().close()
 
+    def create_process_pool(self):
+        # Workers are spawned rather than forked so that they don't inherit the
+        # event loop or any of the threads started by disnake/asyncpg.
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=self.analysis_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_analysis_worker,
+            initargs=(
+                self.config.OCR_BACKEND,
+                self.config.TEXT_DETECTION_MIN_REGIONS,
+                self.config.TESSERACT_CMD,
+                self.config.TEXT_DETECTION_MAX_HEIGHT,
+            ),
+        )
+
+    def create_transcription_pool(self):
+        # Each worker keeps its Whisper model loaded for the lifetime of the
+        # process, so the pool size doubles as the transcription concurrency.
+        # With preloading, every worker loads the model as soon as it starts.
+        preload = self.config.WHISPER_PRELOAD
+        self.transcription_pool = ProcessPoolExecutor(
+            max_workers=self.config.WHISPER_MAX_CONCURRENCY,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=preload_model if preload else None,
+            initargs=(self.config.WHISPER_MODEL,) if preload else (),
+        )
+
+        # Workers are started on demand, so submitting one job per worker
+        # starts them all now instead of on the first transcriptions. The
+        # jobs themselves do nothing, since the model is already loaded.
+        if preload:
+            for _ in range(self.config.WHISPER_MAX_CONCURRENCY):
+                self.transcription_pool.submit(preload_model, self.config.WHISPER_MODEL)
+
+    async def _run_in_pool(self, pool_name: str, create_pool, job):
+        pool = getattr(self, pool_name)
+        future = self.loop.run_in_executor(pool, job)
+        try:
+            return await asyncio.wait_for(future, timeout=self.config.ANALYSIS_TIMEOUT)
+        except asyncio.TimeoutError:
+            # A job can't be stopped once a worker runs it, and a hung one
+            # would hold its worker forever, so new jobs go to a new pool.
+            # The old pool's other jobs get as long to finish before its
+            # workers are terminated.
+            logger.error(
+                f"Job timed out in process pool `{pool_name}`. Recycling it..."
+            )
+            self._replace_pool(
+                pool_name, pool, create_pool, self.config.ANALYSIS_TIMEOUT
+            )
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM killed), so replace the pool before
+            # propagating the error to the caller.
+            logger.error(f"Process pool `{pool_name}` is broken. Recreating it...")
+            self._replace_pool(pool_name, pool, create_pool)
+            raise
+
+    def _replace_pool(
+        self,
+        pool_name: str,
+        pool: ProcessPoolExecutor,
+        create_pool,
+        grace_period: float | None = None,
+    ):
+        # Concurrent jobs of the same pool may all fail, but only the first
+        # one replaces it, rather than shutting down its replacement
+        if getattr(self, pool_name) is not pool:
+            return
+        create_pool()
+
+        # The executor has no public way to kill its workers (before Python
+        # 3.14), and they are only reachable until the pool is shut down
+        workers = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=grace_period is None)
+        if grace_period is not None:
+            self.loop.call_later(grace_period, self._terminate_workers, workers)
+
+    @staticmethod
+    def _terminate_workers(workers: list[multiprocessing.Process]) -> None:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    async def run_analysis(self, func, *args, **kwargs) -> MediaAnalysis:
+        """Run a media analysis function in the process pool.
+
+        The event loop keeps serving the gateway while the job runs. Raises
+        :class:`asyncio.TimeoutError` if the job exceeds `ANALYSIS_TIMEOUT`.
+        """
+        return await self._run_in_pool(
+            "process_pool",
+            self.create_process_pool,
+            functools.partial(func, *args, **kwargs),
+        )
+
+    async def run_image_analysis(
+        self, media: str | bytes, kind: str = "live", guild_id: int | None = None
+    ) -> MediaAnalysis:
+        """Hash and OCR an image, with Florence-2 if it is configured and healthy.
+
+        The image is hashed in the process pool while Florence-2 reads its
+        text. Tesseract is used instead while the circuit breaker of the
+        endpoint is open, and whenever a request fails. With
+        `FLORENCE_2_RACE`, both engines run at once and the first non-empty
+        text wins.
+        """
+        analysis_slot = functools.partial(self.analysis_scheduler.slot, kind, guild_id)
+
+        if self.florence is None or not self.florence.available:
+            async with analysis_slot():
+                return await self.run_analysis(analyze_image, media)
+
+        async def hash_image():
+            async with analysis_slot():
+                return await self.run_analysis(analyze_image, media, ocr=False)
+
+        async def tesseract():
+            async with analysis_slot():
+                return await self.run_analysis(extract_image_text, media)
+
+        async def florence():
+            text = await self.florence.ocr(media)
+            return text if text is not None else await tesseract()
+
+        read_text = (
+            self.race_ocr(media, analysis_slot)
+            if self.config.FLORENCE_2_RACE
+            else florence()
+        )
+        analysis, text_ocr = await asyncio.gather(hash_image(), read_text)
+        return analysis._replace(text_ocr=text_ocr)
+
+    async def race_ocr(self, media: str | bytes, analysis_slot: Callable) -> str | None:
+        """Run Florence-2 and Tesseract at once, and keep the first non-empty text.
+
+        Florence-2 is cancelled if it loses, and so is Tesseract while it is
+        still waiting for an analysis slot. Once Tesseract is running in the
+        process pool, it can't be stopped, so it is left to finish in the
+        background and keeps its slot until then. Errors are only raised if
+        neither engine produced any text.
+        """
+        started = asyncio.Event()
+
+        async def tesseract():
+            async with analysis_slot():
+                started.set()
+                return await self.run_analysis(extract_image_text, media)
+
+        florence_task = asyncio.create_task(self.florence.ocr(media))
+        tesseract_task = asyncio.create_task(tesseract())
+        tasks = [florence_task, tesseract_task]
+        text, error = None, None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except Exception as e:
+                    error = e
+                    continue
+                if result:
+                    return result
+                text = result if text is None else text
+        finally:
+            florence_task.cancel()
+            if not started.is_set():
+                tesseract_task.cancel()
+            elif not tesseract_task.done():
+                self.ocr_race_losers.add(tesseract_task)
+                tesseract_task.add_done_callback(self._discard_ocr_race_loser)
+
+        if text is None and error is not None:
+            raise error
+        return text
+
+    def _discard_ocr_race_loser(self, task: asyncio.Task) -> None:
+        self.ocr_race_losers.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(
+                f"Tesseract failed after losing an OCR race: {task.exception()}"
+            )
+
+    async def run_video_analysis(
+        self, path: str, ocr: bool = False, with_audio: bool = False
+    ) -> tuple[MediaAnalysis, np.ndarray | None]:
+        """Analyse a video in the process pool with the configured decoding mode.
+
+        Returns the analysis and, if `with_audio` is set and the video is
+        decoded in a single pass, its audio waveform for transcription. OCR
+        is limited to `VIDEO_OCR_TIME_BUDGET` seconds.
+        """
+        return await self.run_analysis(
+            analyze_video,
+            path,
+            self.temp_dir,
+            single_pass=self.config.VIDEO_SINGLE_PASS,
+            sample_fps=self.config.VIDEO_SAMPLE_FPS,
+            frame_size=self.config.VIDEO_FRAME_SIZE,
+            ocr=ocr,
+            ocr_time_budget=self.config.VIDEO_OCR_TIME_BUDGET,
+            with_audio=with_audio,
+        )
+
+    async def run_transcription(
+        self, source: str | np.ndarray, kind: str = "live", guild_id: int | None = None
+    ) -> Transcription:
+        """Transcribe a video (or its decoded audio) with one of the warm Whisper workers.
+
+        At most `WHISPER_MAX_CONCURRENCY` transcriptions run at once, and
+        waiting ones are started by the priority of their job class. Raises
+        :class:`asyncio.TimeoutError` if the job exceeds `ANALYSIS_TIMEOUT`.
+        """
+        async with self.transcription_scheduler.slot(kind, guild_id):
+            return await self._run_in_pool(
+                "transcription_pool",
+                self.create_transcription_pool,
+                functools.partial(transcribe_video, source, self.config.WHISPER_MODEL),
+            )
+
     def create_temp_dir(self):
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "tmp-sauron-bot")
+        self.temp_dir = os.path.join(tempfile.gettempdir(), self.temp_dir_name)
         if not os.path.exists(self.temp_dir):
             os.mkdir(self.temp_dir)
-
-    def clear_temp_dir(self):
-        for file in os.listdir(self.temp_dir):
-            file_path = os.path.join(self.temp_dir, file)
-            try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except Exception as e:
-                logger.error(f"Error deleting {file}: {e}")
+        self.media_cache = MediaCache(
+            os.path.join(self.temp_dir, "media"), self.config.MEDIA_CACHE_MAX_BYTES
+        )
 
     async def create_settings_entry(self):
         pass  # TODO
@@ -109,25 +653,253 @@ class SauronBot(commands.InteractionBot):
         async with self.pool.acquire() as connection:
             return await connection.fetch(query, *args)
 
-    async def insert_media_record(
+    async def fetch_records(
+        self, record_type: type[RecordT], query: str, *args
+    ) -> list[RecordT]:
+        """Execute a query whose select list is `record_type.COLUMNS`."""
+        return record_type.from_rows(await self.execute_query(query, *args))
+
+    def index_records(self, records: list[IndexEntry]) -> None:
+        """Add new or updated records to the hash index.
+
+        Cached search results of their guilds are invalidated, since they
+        may now be incomplete.
+        """
+        for record in records:
+            self.hash_index.add(record.guild_id, record.id, record.hash)
+        for guild_id in {record.guild_id for record in records}:
+            self.search_cache.invalidate(guild_id)
+
+    def unindex_records(self, records: list[IndexEntry]) -> None:
+        """Remove deleted records from the hash index."""
+        for record in records:
+            self.hash_index.remove(record.guild_id, record.id)
+        for guild_id in {record.guild_id for record in records}:
+            self.search_cache.invalidate(guild_id)
+
+    def on_record_change(self, connection, pid: int, channel: str, payload: str):
+        """Apply a record change notification to the hash index."""
+        change = json.loads(payload)
+        if change["op"] == "DELETE":
+            self.hash_index.remove(change["guild_id"], change["id"])
+        else:
+            self.hash_index.add(change["guild_id"], change["id"], change["hash"])
+        self.search_cache.invalidate(change["guild_id"])
+
+    async def load_hash_index(self) -> None:
+        query = f"""
+            SELECT {IndexEntry.COLUMNS}
+            FROM media_fingerprints
+            WHERE hash IS NOT NULL;
+        """
+        result = await self.execute_query(query)
+        self.hash_index.load(tuple(record) for record in result)
+
+    async def find_similar_media(
+        self, hash: int, max_hamming_distance: int, guild_id: int
+    ) -> list[MatchCheck]:
+        """Find the records of a guild within a Hamming distance of a hash."""
+        record_ids = self.hash_index.search(guild_id, hash, max_hamming_distance)
+        if not record_ids:
+            return []
+
+        query = f"""
+            SELECT {MatchCheck.COLUMNS}
+            FROM media_fingerprints
+            WHERE id = ANY($1::int[]);
+        """
+        return await self.fetch_records(MatchCheck, query, record_ids)
+
+    async def find_text_matches(
+        self, text: str, guild_id: int, limit: int
+    ) -> list[int]:
+        """Find the records of a guild whose OCR text or transcription matches a query.
+
+        Trigram similarity and full text search over both columns run in a
+        single query. Their rankings are merged with reciprocal rank fusion,
+        so a record matched by several of them ranks higher, and only the
+        identifiers of the `limit` best records are returned.
+        """
+        query = """
+            WITH ocr_trigram AS (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY text_ocr <-> $1) AS rank
+                FROM media_fingerprints
+                WHERE text_ocr % $1
+                AND guild_id = $2
+                ORDER BY rank
+                LIMIT $3
+            ), ocr_fts AS (
+                SELECT id, ROW_NUMBER() OVER (
+                    ORDER BY ts_rank_cd(text_ocr_vector, tsquery) DESC
+                ) AS rank
+                FROM media_fingerprints, plainto_tsquery('english', $1) AS tsquery
+                WHERE text_ocr_vector @@ tsquery
+                AND guild_id = $2
+                ORDER BY rank
+                LIMIT $3
+            ), transcript_trigram AS (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY video_transcription <-> $1) AS rank
+                FROM media_fingerprints
+                WHERE video_transcription % $1
+                AND guild_id = $2
+                ORDER BY rank
+                LIMIT $3
+            ), transcript_fts AS (
+                SELECT id, ROW_NUMBER() OVER (
+                    ORDER BY ts_rank_cd(video_transcription_vector, tsquery) DESC
+                ) AS rank
+                FROM media_fingerprints, plainto_tsquery('english', $1) AS tsquery
+                WHERE video_transcription_vector @@ tsquery
+                AND guild_id = $2
+                ORDER BY rank
+                LIMIT $3
+            ), fused AS (
+                SELECT id, SUM(1.0 / (60 + rank)) AS score
+                FROM (
+                    SELECT * FROM ocr_trigram
+                    UNION ALL SELECT * FROM ocr_fts
+                    UNION ALL SELECT * FROM transcript_trigram
+                    UNION ALL SELECT * FROM transcript_fts
+                ) AS ranks
+                GROUP BY id
+            )
+            SELECT id
+            FROM fused
+            ORDER BY score DESC, id
+            LIMIT $3;
+        """
+        result = await self.execute_query(query, text, guild_id, limit)
+        return [record["id"] for record in result]
+
+    def analysis_mode(self, content_type: str) -> str:
+        """Describe the settings that shape the analysis of an attachment.
+
+        A cached analysis is only reused if it was produced in the same mode,
+        so changing e.g. `VIDEO_OCR` doesn't keep serving the old results.
+        """
+        if not utils.is_video_content_type(content_type):
+            return f"image/v{ANALYSIS_VERSION}"
+        return (
+            f"video/v{ANALYSIS_VERSION}"
+            f"/single_pass={int(self.config.VIDEO_SINGLE_PASS)}"
+            f"/ocr={int(self.config.VIDEO_OCR)}"
+            f"/ocr_time_budget={self.config.VIDEO_OCR_TIME_BUDGET}"
+            f"/sample_fps={self.config.VIDEO_SAMPLE_FPS}"
+            f"/frame_size={self.config.VIDEO_FRAME_SIZE}"
+        )
+
+    async def get_cached_analysis(
+        self, digest: bytes, mode: str
+    ) -> MediaAnalysis | None:
+        """Get the cached analysis of an attachment by the digest of its bytes.
+
+        Entries produced in another analysis mode are misses.
+        """
+        query = """
+            UPDATE media_analysis_cache
+            SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE digest = $1 AND mode = $2
+            RETURNING hash, text_ocr, video_transcription;
+        """
+        result = await self.execute_query(query, digest, mode)
+        if not result:
+            self.analysis_cache_misses += 1
+            return None
+        self.analysis_cache_hits += 1
+        return MediaAnalysis(*result[0])
+
+    async def cache_analysis(
         self,
-        message: disnake.Message,
-        attachment_index: int,
-        update_existing: bool = False,
-        record_id: int = None,
-    ) -> None | list[dict]:
-        # Error checking
-        if not update_existing and record_id:
-            raise ValueError(
-                "Cannot specify a Record Identifier without setting `update_existing` parameter."
+        digest: bytes,
+        mode: str,
+        content_type: str,
+        size: int,
+        analysis: MediaAnalysis,
+    ) -> None:
+        """Store the analysis of an attachment by the digest of its bytes."""
+        query = """
+            INSERT INTO media_analysis_cache (digest, mode, hash, text_ocr, video_transcription, content_type, size)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (digest) DO UPDATE
+            SET mode = $2, hash = $3, text_ocr = $4, video_transcription = $5, content_type = $6, size = $7, last_used_at = CURRENT_TIMESTAMP;
+        """
+        await self.execute_query(
+            query,
+            digest,
+            mode,
+            analysis.hash,
+            analysis.text_ocr,
+            analysis.video_transcription,
+            content_type,
+            size,
+        )
+
+    async def evict_analysis_cache(self) -> int:
+        """Evict analysis cache entries that are too old or over the size limit.
+
+        Returns
+        -------
+        :class:`int`
+            The number of evicted entries.
+        """
+        query = """
+            WITH expired AS (
+                SELECT digest
+                FROM media_analysis_cache
+                WHERE last_used_at < CURRENT_TIMESTAMP - make_interval(days => $1)
+            ), overflow AS (
+                SELECT digest
+                FROM media_analysis_cache
+                ORDER BY last_used_at DESC
+                OFFSET $2
             )
+            DELETE FROM media_analysis_cache
+            WHERE digest IN (SELECT digest FROM expired UNION SELECT digest FROM overflow)
+            RETURNING digest;
+        """
+        result = await self.execute_query(
+            query,
+            self.config.ANALYSIS_CACHE_MAX_AGE_DAYS,
+            self.config.ANALYSIS_CACHE_MAX_ENTRIES,
+        )
+        return len(result)
 
-        logger.info(f"[{attachment_index}] {message.jump_url}")
+    async def get_channel_watermarks(self, channel_ids: list[int]) -> dict[int, int]:
+        """Get the newest ingested message of each channel.
 
-        # Get the attachment
-        attachment = message.attachments[attachment_index]
+        Channels without a watermark fall back to their newest record, and
+        are left out if they have none.
+        """
+        query = """
+            SELECT c.channel_id, COALESCE(
+                w.last_message_id,
+                (SELECT MAX(message_id) FROM media_fingerprints m WHERE m.channel_id = c.channel_id)
+            ) AS last_message_id
+            FROM unnest($1::bigint[]) AS c (channel_id)
+            LEFT JOIN channel_watermarks w USING (channel_id);
+        """
+        result = await self.execute_query(query, channel_ids)
+        return {
+            record["channel_id"]: record["last_message_id"]
+            for record in result
+            if record["last_message_id"] is not None
+        }
 
-        # Check if the attachment already exists in the database
+    async def advance_channel_watermark(
+        self, guild_id: int, channel_id: int, message_id: int
+    ) -> None:
+        """Record that every message of a channel up to `message_id` was ingested."""
+        query = """
+            INSERT INTO channel_watermarks (channel_id, guild_id, last_message_id)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (channel_id) DO UPDATE
+            SET last_message_id = GREATEST(channel_watermarks.last_message_id, EXCLUDED.last_message_id),
+                updated_at = CURRENT_TIMESTAMP;
+        """
+        await self.execute_query(query, channel_id, guild_id, message_id)
+
+    async def check_attachment_exists(self, job: AttachmentJob) -> bool:
+        """Check if an attachment already exists in the database."""
         query = """
             SELECT EXISTS (
                 SELECT 1
@@ -139,157 +911,745 @@ class SauronBot(commands.InteractionBot):
             );
         """
         exists = await self.execute_query(
-            query, message.id, message.channel.id, message.guild.id, attachment.filename
+            query, job.message_id, job.channel_id, job.guild_id, job.filename
         )
-        exists: bool = exists[0][0]
-        if exists and not update_existing:
-            logger.info(
-                f"└ Attachment {attachment.filename} already exists in the database."
-            )
-            return
+        return exists[0][0]
 
-        # Get the content type
-        content_type = utils.get_content_type(attachment)
-        if content_type is None:
-            logger.error(
-                f"└ Attachment {attachment.filename} has invalid content type {attachment.content_type}"
-            )
-            return
+    async def filter_existing_attachments(
+        self, jobs: list[AttachmentJob]
+    ) -> list[bool]:
+        """Check which attachments already exist in the database with a single query.
+
+        Returns
+        -------
+        List[:class:`bool`]
+            Whether each job's attachment exists, in the same order as `jobs`.
+        """
+        query = """
+            SELECT message_id, channel_id, guild_id, filename
+            FROM media_fingerprints
+            JOIN unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::text[])
+                AS jobs (message_id, channel_id, guild_id, filename)
+            USING (message_id, channel_id, guild_id, filename);
+        """
+        result = await self.execute_query(
+            query,
+            [job.message_id for job in jobs],
+            [job.channel_id for job in jobs],
+            [job.guild_id for job in jobs],
+            [job.filename for job in jobs],
+        )
+        existing = {tuple(record) for record in result}
+        return [
+            (job.message_id, job.channel_id, job.guild_id, job.filename) in existing
+            for job in jobs
+        ]
+
+    async def download_attachment(self, job: AttachmentJob) -> str | bytes | None:
+        """Download an attachment.
+
+        Images up to `IN_MEMORY_MAX_BYTES` are kept in memory and never touch
+        the filesystem. Everything else (including every video, since the video
+        decoders need a seekable file) is stored in the media cache, and reused
+        from there if it was already downloaded. Callers should pin the job's
+        cache key while they use the file.
+
+        Returns
+        -------
+        Optional[Union[:class:`str`, :class:`bytes`]]
+            The contents of the attachment or the path to the downloaded file,
+            or ``None`` if the download failed.
+        """
+        in_memory = (
+            utils.is_image_content_type(job.content_type)
+            and job.size <= self.config.IN_MEMORY_MAX_BYTES
+        )
+        if not in_memory:
+            file_path = self.media_cache.lookup(job.cache_key)
+            if file_path is not None:
+                return file_path
 
-        # Determine if the message was posted via a bot
-        author_id = message.author.id
-        posted_by_bot = False
-        bot_id = None
-        if message.author.bot:
-            posted_by_bot = True
-            bot_id = author_id
-            if message.type == disnake.MessageType.application_command:
-                author_id = message.interaction.user.id
-
-        # Save the attachment to the cache directory
         try:
-            file_path = os.path.join(self.temp_dir, attachment.filename)
-            await attachment.save(fp=file_path, use_cached=True)
+            async with self.session.get(job.url) as response:
+                if response.status != 200:
+                    logger.error(
+                        f"└ Downloading attachment {job.filename} returned status code `{response.status}`"
+                    )
+                    return None
+                if in_memory:
+                    return await response.read()
+                return await self.save_to_media_cache(job.cache_key, response)
         except Exception as e:
-            logger.exception(f"└ Failed to save attachment {attachment.filename}: {e}")
-            return
+            logger.exception(f"└ Failed to save attachment {job.filename}: {e}")
+            return None
+
+    async def save_to_media_cache(
+        self, key: str, response: aiohttp.ClientResponse
+    ) -> str:
+        """Stream an HTTP response body into the media cache.
+
+        The body is written to a partial file first, so that an interrupted
+        download never leaves a truncated file in the cache.
+        """
+        partial_path = os.path.join(self.temp_dir, f"{key}.{uuid.uuid4().hex}.part")
+        async with aiofiles.open(partial_path, mode="wb") as f:
+            async for chunk in response.content.iter_chunked(1 << 16):
+                await f.write(chunk)
+        file_path = self.media_cache.path(key)
+        os.replace(partial_path, file_path)
+        self.media_cache.add(key)
+        return file_path
+
+    async def analyze_attachment(
+        self, job: AttachmentJob, media: str | bytes, kind: str = "live"
+    ) -> MediaAnalysis | None:
+        """Hash, OCR and transcribe a downloaded attachment.
+
+        Parameters
+        ----------
+        media: Union[:class:`str`, :class:`bytes`]
+            The contents of the attachment or the path to the downloaded file.
+        kind: :class:`str`
+            The class of the ingestion job (`live`, `catch_up` or `scrub`),
+            which sets its priority for the analysis and transcription workers.
+
+        Returns
+        -------
+        Optional[:class:`MediaAnalysis`]
+            The analysis, or ``None`` if the attachment couldn't be processed.
+        """
+        # Reuse the analysis of byte-identical attachments
+        digest = await asyncio.to_thread(utils.content_digest, media)
+        mode = self.analysis_mode(job.content_type)
+        analysis = await self.get_cached_analysis(digest, mode)
+        if analysis is not None:
+            logger.info(f"├ Using cached analysis for {job.filename}")
+            return analysis
 
         # Process the image or video
-        if utils.is_image_content_type(content_type):
-            logger.info(f"├ Processing image {attachment.filename}")
-            try:
-                imageproc = ImageProcessor(file_path)
-                text_ocr = imageproc.ocr(self.config.PREFER_FLORENCE_2)
-                video_transcription = None
-                hash = imageproc.hash
-            except Exception as e:
-                logger.exception(f"└ Failed to process video: {e}")
-                return
-        elif utils.is_video_content_type(content_type):
-            logger.info(f"├ Processing video {attachment.filename}")
-            try:
-                videoproc = VideoProcessor(file_path, self.temp_dir)
-                text_ocr = None  # TODO: Implement OCR for video
-                video_transcription = videoproc.transcribe()
-                hash = videoproc.hash
-            except Exception as e:
-                logger.exception(f"└ Failed to process video: {e}")
-                return
-        else:
+        analysis_slot = functools.partial(
+            self.analysis_scheduler.slot, kind, job.guild_id
+        )
+        try:
+            if utils.is_image_content_type(job.content_type):
+                logger.info(f"├ Processing image {job.filename}")
+                analysis = await self.run_image_analysis(media, kind, job.guild_id)
+            elif utils.is_video_content_type(job.content_type):
+                logger.info(f"├ Processing video {job.filename}")
+                if self.config.VIDEO_SINGLE_PASS:
+                    # The audio is decoded along with the frames, then
+                    # handed to a transcription worker
+                    async with analysis_slot():
+                        analysis, audio = await self.run_video_analysis(
+                            media, ocr=self.config.VIDEO_OCR, with_audio=True
+                        )
+                    if audio is None:
+                        transcription = Transcription("", 0.0, 0.0)
+                    else:
+                        transcription = await self.run_transcription(
+                            audio, kind, job.guild_id
+                        )
+                else:
+
+                    async def analyze_frames():
+                        async with analysis_slot():
+                            return await self.run_video_analysis(
+                                media, ocr=self.config.VIDEO_OCR
+                            )
+
+                    (analysis, _), transcription = await asyncio.gather(
+                        analyze_frames(),
+                        self.run_transcription(media, kind, job.guild_id),
+                    )
+                analysis = analysis._replace(video_transcription=transcription.text)
+                logger.info(
+                    f"├ Transcribed in {transcription.inference_secs:.2f}s (model load {transcription.model_load_secs:.2f}s)"
+                )
+            else:
+                logger.error(
+                    f"└ Attachment {job.filename} has invalid content type {job.content_type}"
+                )
+                return None
+        except asyncio.TimeoutError:
             logger.error(
-                f"└ Attachment {attachment.filename} has invalid content type {attachment.content_type}"
+                f"└ Timed out processing {job.filename} after {self.config.ANALYSIS_TIMEOUT} seconds"
             )
-            return
+            return None
+        except Exception as e:
+            logger.exception(f"└ Failed to process {job.filename}: {e}")
+            return None
+
+        await self.cache_analysis(digest, mode, job.content_type, job.size, analysis)
+        return analysis
+
+    async def store_media_record(
+        self,
+        job: AttachmentJob,
+        analysis: MediaAnalysis,
+        exists: bool = False,
+        update_existing: bool = False,
+        record_id: int = None,
+    ) -> None | list[MatchCheck]:
+        """Insert (or update) the record of an analysed attachment.
+
+        Returns
+        -------
+        Optional[List[:class:`MatchCheck`]]
+            The exact matches of a newly inserted attachment, or ``None`` if
+            an existing record was updated.
+        """
+        hash, text_ocr, video_transcription = analysis
 
         # Update the record if specified
         if record_id and update_existing:
-            query = """
+            query = f"""
                 UPDATE media_fingerprints
                 SET hash = $1, text_ocr = $2, video_transcription = $3, content_type = $4, filename = $5, url = $6, timestamp = $7, attachment_index = $8
-                WHERE id = $8;
+                WHERE id = $9
+                RETURNING {IndexEntry.COLUMNS};
             """
-            await self.execute_query(
+            result = await self.fetch_records(
+                IndexEntry,
                 query,
                 hash,
                 text_ocr,
                 video_transcription,
-                content_type,
-                attachment.filename,
-                attachment.url,
-                message.created_at,
-                attachment_index,
+                job.content_type,
+                job.filename,
+                job.url,
+                job.timestamp,
+                job.attachment_index,
                 record_id,
             )
+            self.index_records(result)
             logger.info(
-                f"└ Record {record_id}: Updated attachment {attachment.filename} in the database."
+                f"└ Record {record_id}: Updated attachment {job.filename} in the database."
             )
             return
         elif exists and update_existing:
-            query = """
+            query = f"""
                 UPDATE media_fingerprints
                 SET hash = $1, text_ocr = $2, video_transcription = $3, content_type = $4, filename = $5, url = $6, timestamp = $7, attachment_index = $8
                 WHERE message_id = $9
                 AND channel_id = $10
-                AND guild_id = $11;
+                AND guild_id = $11
+                AND (attachment_index = $8 OR (attachment_index IS NULL AND filename = $5))
+                RETURNING {IndexEntry.COLUMNS};
             """
-            await self.execute_query(
+            result = await self.fetch_records(
+                IndexEntry,
                 query,
                 hash,
                 text_ocr,
                 video_transcription,
-                content_type,
-                attachment.filename,
-                attachment.url,
-                message.created_at,
-                attachment_index,
-                message.id,
-                message.channel.id,
-                message.guild.id,
+                job.content_type,
+                job.filename,
+                job.url,
+                job.timestamp,
+                job.attachment_index,
+                job.message_id,
+                job.channel_id,
+                job.guild_id,
             )
-            logger.info(f"└ Updated attachment {attachment.filename} in the database.")
+            self.index_records(result)
+            logger.info(f"└ Updated attachment {job.filename} in the database.")
             return
 
         # Find exact matches in the database
-        query = """
-            SELECT *
-            FROM media_fingerprints
-            WHERE hash <@ ($1, $2)
-            AND guild_id = $3;
-        """
         max_hamming_distance = 0
-        matches = await self.execute_query(
-            query, hash, max_hamming_distance, message.guild.id
+        matches = await self.find_similar_media(
+            hash, max_hamming_distance, job.guild_id
         )
         logger.info(f"├ Found {len(matches)} exact matches.")
-        logger.debug(f"├ Exact matches: {[match['id'] for match in matches]}")
+        logger.debug(f"├ Exact matches: {[match.id for match in matches]}")
 
         # Insert into the database
-        query = """
+        query = f"""
             INSERT INTO media_fingerprints (hash, text_ocr, video_transcription, content_type, filename, attachment_index, url, timestamp, guild_id, channel_id, message_id, author_id, by_bot, bot_id)
             VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
-            RETURNING *;
+            RETURNING {IndexEntry.COLUMNS};
         """
-        result = await self.execute_query(
+        result = await self.fetch_records(
+            IndexEntry,
             query,
             hash,
             text_ocr,
             video_transcription,
-            content_type,
-            attachment.filename,
-            attachment_index,
-            attachment.url,
-            message.created_at,
-            message.guild.id,
-            message.channel.id,
-            message.id,
-            author_id,
-            posted_by_bot,
-            bot_id,
+            job.content_type,
+            job.filename,
+            job.attachment_index,
+            job.url,
+            job.timestamp,
+            job.guild_id,
+            job.channel_id,
+            job.message_id,
+            job.author_id,
+            job.by_bot,
+            job.bot_id,
         )
+        self.index_records(result)
         for record in result:
-            logger.info(f"├ Inserted media {record['id']} into database.")
+            logger.info(f"├ Inserted media {record.id} into database.")
             logger.info(f"├ Hash: {hash}")
             logger.info(f"├ OCR Text: {repr(text_ocr)}")
             logger.info(f"└ Transcription: {repr(video_transcription)}")
 
         return matches
+
+    async def create_scrub_job(
+        self,
+        channel: disnake.TextChannel,
+        oldest_first: bool = True,
+        update_existing: bool = False,
+        limit: int | None = None,
+        cursor_message_id: int | None = None,
+    ) -> ScrubJob:
+        query = f"""
+            INSERT INTO scrub_jobs (guild_id, channel_id, oldest_first, update_existing, message_limit, cursor_message_id)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            RETURNING {ScrubJob.COLUMNS};
+        """
+        result = await self.fetch_records(
+            ScrubJob,
+            query,
+            channel.guild.id,
+            channel.id,
+            oldest_first,
+            update_existing,
+            limit,
+            cursor_message_id,
+        )
+        return result[0]
+
+    async def get_scrub_jobs(
+        self, guild_id: int | None = None, statuses: list[str] | None = None
+    ) -> list[ScrubJob]:
+        """Get the scrubs of a guild (or of every guild), newest first."""
+        query = f"""
+            SELECT {ScrubJob.COLUMNS}
+            FROM scrub_jobs
+            WHERE ($1::bigint IS NULL OR guild_id = $1)
+            AND ($2::text[] IS NULL OR status = ANY($2))
+            ORDER BY id DESC;
+        """
+        return await self.fetch_records(ScrubJob, query, guild_id, statuses)
+
+    async def save_scrub_progress(
+        self, job: ScrubJob, stats: PipelineStats, status: str
+    ) -> None:
+        """Checkpoint a scrub, adding the progress of this run to the job's."""
+        query = """
+            UPDATE scrub_jobs
+            SET status = $2, cursor_message_id = $3, messages_scanned = $4, written = $5, skipped = $6, failed = $7, updated_at = CURRENT_TIMESTAMP
+            WHERE id = $1;
+        """
+        await self.execute_query(
+            query,
+            job.id,
+            status,
+            stats.checkpoint or job.cursor_message_id,
+            job.messages_scanned + stats.checkpointed,
+            job.written + stats.counts.get("written", stats.counts.get("queued", 0)),
+            job.skipped + stats.skipped,
+            job.failed + stats.failed,
+        )
+
+    def start_scrub_job(
+        self,
+        job: ScrubJob,
+        on_progress: Callable[[PipelineStats], Awaitable[None]] | None = None,
+    ) -> asyncio.Task:
+        """Run a scrub in the background, from its cursor.
+
+        The scrub is checkpointed on every progress report, and when it
+        ends. Cancelling the task pauses the scrub.
+        """
+        task = asyncio.create_task(self.run_scrub_job(job, on_progress))
+        self.scrub_tasks[job.id] = task
+        task.add_done_callback(lambda _: self.scrub_tasks.pop(job.id, None))
+        return task
+
+    async def run_scrub_job(
+        self,
+        job: ScrubJob,
+        on_progress: Callable[[PipelineStats], Awaitable[None]] | None = None,
+    ) -> PipelineStats:
+        channel = await self.fetch_channel(job.channel_id)
+
+        # Continue straight from the cursor instead of replaying the history
+        limit = job.message_limit
+        if limit is not None:
+            limit = max(0, limit - job.messages_scanned)
+        cursor = job.cursor_message_id
+        cursor = disnake.Object(id=cursor) if cursor is not None else None
+        if job.oldest_first:
+            messages = channel.history(limit=limit, after=cursor, oldest_first=True)
+        else:
+            messages = channel.history(limit=limit, before=cursor, oldest_first=False)
+
+        pipeline = IngestionPipeline(
+            self,
+            update_existing=job.update_existing,
+            download_workers=self.config.SCRUB_DOWNLOAD_WORKERS,
+            analysis_workers=self.config.SCRUB_ANALYSIS_WORKERS,
+            queue_size=self.config.SCRUB_QUEUE_SIZE,
+            batch_size=self.config.SCRUB_BATCH_SIZE,
+            flush_interval=self.config.SCRUB_FLUSH_INTERVAL,
+            kind="scrub",
+            enqueue=self.config.INGESTION_QUEUE,
+        )
+
+        async def checkpoint(stats: PipelineStats):
+            await self.save_scrub_progress(job, stats, "running")
+            if on_progress is not None:
+                await on_progress(stats)
+
+        logger.info(f"Starting scrub {job.id} of channel {job.channel_id}")
+        status = "failed"
+        try:
+            stats = await pipeline.run(messages, on_progress=checkpoint)
+            status = "finished"
+            return stats
+        except asyncio.CancelledError:
+            status = "paused"
+            raise
+        finally:
+            await self.save_scrub_progress(job, pipeline.stats, status)
+            logger.info(f"Scrub {job.id} {status}. {pipeline.stats}")
+
+    async def store_media_records(
+        self,
+        items: list[tuple[AttachmentJob, bool, MediaAnalysis]],
+        update_existing: bool = False,
+    ) -> None:
+        """Insert (or update) the records of many analysed attachments at once.
+
+        The whole batch is written in a single transaction with one `UPDATE`
+        and one `INSERT` statement, both fed from arrays with `unnest`, so
+        that the new record identifiers can be returned for the hash index.
+        """
+        updates = []
+        inserts = []
+        for job, exists, analysis in items:
+            if exists and update_existing:
+                updates.append((job, analysis))
+            elif not exists:
+                inserts.append((job, analysis))
+
+        updated = []
+        inserted = []
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                if updates:
+                    query = """
+                        UPDATE media_fingerprints
+                        SET hash = u.hash, text_ocr = u.text_ocr, video_transcription = u.video_transcription, content_type = u.content_type, filename = u.filename, url = u.url, timestamp = u.timestamp, attachment_index = u.attachment_index
+                        FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::text[], $6::text[], $7::timestamptz[], $8::int[], $9::bigint[], $10::bigint[], $11::bigint[])
+                            AS u (hash, text_ocr, video_transcription, content_type, filename, url, timestamp, attachment_index, message_id, channel_id, guild_id)
+                        WHERE media_fingerprints.message_id = u.message_id
+                        AND media_fingerprints.channel_id = u.channel_id
+                        AND media_fingerprints.guild_id = u.guild_id
+                        AND (
+                            media_fingerprints.attachment_index = u.attachment_index
+                            OR (media_fingerprints.attachment_index IS NULL AND media_fingerprints.filename = u.filename)
+                        )
+                        RETURNING media_fingerprints.id, media_fingerprints.guild_id, media_fingerprints.hash;
+                    """
+                    updated = await connection.fetch(
+                        query,
+                        [analysis.hash for _, analysis in updates],
+                        [analysis.text_ocr for _, analysis in updates],
+                        [analysis.video_transcription for _, analysis in updates],
+                        [job.content_type for job, _ in updates],
+                        [job.filename for job, _ in updates],
+                        [job.url for job, _ in updates],
+                        [job.timestamp for job, _ in updates],
+                        [job.attachment_index for job, _ in updates],
+                        [job.message_id for job, _ in updates],
+                        [job.channel_id for job, _ in updates],
+                        [job.guild_id for job, _ in updates],
+                    )
+
+                if inserts:
+                    query = f"""
+                        INSERT INTO media_fingerprints (hash, text_ocr, video_transcription, content_type, filename, attachment_index, url, timestamp, guild_id, channel_id, message_id, author_id, by_bot, bot_id)
+                        SELECT *
+                        FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::text[], $6::int[], $7::text[], $8::timestamptz[], $9::bigint[], $10::bigint[], $11::bigint[], $12::bigint[], $13::bool[], $14::bigint[])
+                        RETURNING {IndexEntry.COLUMNS};
+                    """
+                    inserted = await connection.fetch(
+                        query,
+                        [analysis.hash for _, analysis in inserts],
+                        [analysis.text_ocr for _, analysis in inserts],
+                        [analysis.video_transcription for _, analysis in inserts],
+                        [job.content_type for job, _ in inserts],
+                        [job.filename for job, _ in inserts],
+                        [job.attachment_index for job, _ in inserts],
+                        [job.url for job, _ in inserts],
+                        [job.timestamp for job, _ in inserts],
+                        [job.guild_id for job, _ in inserts],
+                        [job.channel_id for job, _ in inserts],
+                        [job.message_id for job, _ in inserts],
+                        [job.author_id for job, _ in inserts],
+                        [job.by_bot for job, _ in inserts],
+                        [job.bot_id for job, _ in inserts],
+                    )
+
+        # Only index the new hashes once the transaction has been committed
+        self.index_records(IndexEntry.from_rows((*updated, *inserted)))
+        logger.info(
+            f"Wrote batch of {len(inserted)} new and {len(updated)} updated records to the database."
+        )
+
+    async def enqueue_attachments(
+        self, jobs: list[AttachmentJob], kind: str, update_existing: bool = False
+    ) -> None:
+        """Add attachments to the ingestion queue, for the ingestion workers.
+
+        Parameters
+        ----------
+        kind: :class:`str`
+            Where the jobs came from, one of `live`, `catch_up` or `scrub`.
+            Only the matches of `live` jobs are reported back to the bot.
+        """
+        query = """
+            INSERT INTO ingestion_jobs (kind, update_existing, guild_id, channel_id, message_id, attachment_index, filename, url, size, content_type, timestamp, author_id, by_bot, bot_id)
+            SELECT $1::text, $2::boolean, *
+            FROM unnest($3::bigint[], $4::bigint[], $5::bigint[], $6::int[], $7::text[], $8::text[], $9::int[], $10::text[], $11::timestamptz[], $12::bigint[], $13::boolean[], $14::bigint[]);
+        """
+        columns = [list(column) for column in zip(*jobs)]
+        await self.execute_query(query, kind, update_existing, *columns)
+
+    async def claim_queued_attachments(
+        self, worker: str, kind: str, limit: int
+    ) -> list[QueuedAttachment]:
+        """Claim up to `limit` queued attachments of a job class for a worker.
+
+        Guilds take turns, each with its oldest jobs first, so that a large
+        backlog of one guild doesn't hold up the others. Jobs locked by
+        another worker's claim are skipped rather than waited on, so any
+        number of workers can claim jobs at the same time.
+
+        Only the oldest `limit` jobs of every guild are considered, so a
+        claim reads a few rows of the queued jobs index per guild, however
+        large the backlog is. The guilds themselves are found by skipping
+        through the index, one guild at a time.
+        """
+        query = f"""
+            WITH RECURSIVE guilds AS (
+                (
+                    SELECT guild_id
+                    FROM ingestion_jobs
+                    WHERE status = 'queued'
+                    AND kind = $2
+                    ORDER BY guild_id
+                    LIMIT 1
+                )
+                UNION ALL
+                SELECT (
+                    SELECT j.guild_id
+                    FROM ingestion_jobs j
+                    WHERE j.status = 'queued'
+                    AND j.kind = $2
+                    AND j.guild_id > g.guild_id
+                    ORDER BY j.guild_id
+                    LIMIT 1
+                )
+                FROM guilds g
+                WHERE g.guild_id IS NOT NULL
+            ),
+            candidates AS (
+                SELECT c.id, c.turn
+                FROM guilds g
+                CROSS JOIN LATERAL (
+                    SELECT j.id, ROW_NUMBER() OVER (ORDER BY j.id) AS turn
+                    FROM ingestion_jobs j
+                    WHERE j.status = 'queued'
+                    AND j.kind = $2
+                    AND j.guild_id = g.guild_id
+                    ORDER BY j.id
+                    LIMIT $3
+                ) c
+                WHERE g.guild_id IS NOT NULL
+            )
+            UPDATE ingestion_jobs
+            SET status = 'running', worker = $1, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT j.id
+                FROM ingestion_jobs j
+                JOIN candidates c USING (id)
+                WHERE j.status = 'queued'
+                ORDER BY c.turn, c.id
+                LIMIT $3
+                FOR UPDATE OF j SKIP LOCKED
+            )
+            RETURNING {QueuedAttachment.COLUMNS};
+        """
+        return await self.fetch_records(QueuedAttachment, query, worker, kind, limit)
+
+    async def finish_queued_attachment(
+        self, job_id: int, matches: list[MatchCheck] | None
+    ) -> None:
+        """Mark a queued attachment as ingested, along with its matches."""
+        query = """
+            UPDATE ingestion_jobs
+            SET status = 'done', matches = $2, error = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = $1;
+        """
+        await self.execute_query(query, job_id, [match.id for match in matches or []])
+
+    async def fail_queued_attachment(
+        self, job_id: int, error: str, max_attempts: int
+    ) -> None:
+        """Requeue a queued attachment that failed, unless it ran out of attempts."""
+        query = """
+            UPDATE ingestion_jobs
+            SET status = CASE WHEN attempts < $3 THEN 'queued' ELSE 'failed' END,
+                error = $2,
+                finished_at = CASE WHEN attempts < $3 THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE id = $1;
+        """
+        await self.execute_query(query, job_id, error, max_attempts)
+
+    async def renew_queued_attachments(self, worker: str) -> int:
+        """Report that a worker is still ingesting the attachments it claimed.
+
+        Returns
+        -------
+        :class:`int`
+            The number of renewed jobs.
+        """
+        query = """
+            UPDATE ingestion_jobs
+            SET heartbeat_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+            AND worker = $1
+            RETURNING id;
+        """
+        result = await self.execute_query(query, worker)
+        return len(result)
+
+    async def recover_queued_attachments(
+        self, lock_timeout: float, max_attempts: int
+    ) -> int:
+        """Requeue the attachments claimed by workers that died while ingesting them.
+
+        A worker is considered dead once it hasn't renewed its jobs for
+        `lock_timeout` seconds, however long the jobs themselves take.
+
+        Returns
+        -------
+        :class:`int`
+            The number of recovered jobs.
+        """
+        query = """
+            UPDATE ingestion_jobs
+            SET status = CASE WHEN attempts < $2 THEN 'queued' ELSE 'failed' END,
+                error = 'Timed out waiting for worker ' || worker,
+                finished_at = CASE WHEN attempts < $2 THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE status = 'running'
+            AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+            RETURNING id;
+        """
+        result = await self.execute_query(query, lock_timeout, max_attempts)
+        return len(result)
+
+    async def purge_queued_attachments(self, max_age_days: int = 1) -> int:
+        """Delete ingested attachments from the queue. Failed ones are kept."""
+        query = """
+            DELETE FROM ingestion_jobs
+            WHERE status = 'done'
+            AND finished_at < CURRENT_TIMESTAMP - make_interval(days => $1)
+            RETURNING id;
+        """
+        result = await self.execute_query(query, max_age_days)
+        return len(result)
+
+    async def on_ingestion_result(
+        self, connection, pid: int, channel: str, payload: str
+    ):
+        """React to a live message once a worker found that it is a repost."""
+        result = json.loads(payload)
+        if not result["matches"]:
+            return
+        logger.info(
+            f"Ingestion job {result['id']} found {len(result['matches'])} matches."
+        )
+        try:
+            await self.add_repost_reaction(result["channel_id"], result["message_id"])
+        except disnake.HTTPException as e:
+            logger.error(f"Failed to react to message {result['message_id']}: {e}")
+
+    async def add_repost_reaction(self, channel_id: int, message_id: int) -> None:
+        channel = self.get_channel(channel_id) or await self.fetch_channel(channel_id)
+        await channel.get_partial_message(message_id).add_reaction(REPOST_EMOJI)
+
+    async def insert_media_record(
+        self,
+        message: disnake.Message,
+        attachment_index: int,
+        update_existing: bool = False,
+        record_id: int = None,
+        kind: str = "live",
+        raise_on_failure: bool = False,
+    ) -> None | list[MatchCheck]:
+        # Error checking
+        if not update_existing and record_id:
+            raise ValueError(
+                "Cannot specify a Record Identifier without setting `update_existing` parameter."
+            )
+
+        logger.info(f"[{attachment_index}] {message.jump_url}")
+        job = AttachmentJob.from_message(message, attachment_index)
+        return await self.ingest_attachment(
+            job, update_existing, record_id, kind, raise_on_failure
+        )
+
+    async def ingest_attachment(
+        self,
+        job: AttachmentJob,
+        update_existing: bool = False,
+        record_id: int = None,
+        kind: str = "live",
+        raise_on_failure: bool = False,
+    ) -> None | list[MatchCheck]:
+        """Download, analyse and store a single attachment as a job of class `kind`.
+
+        If `raise_on_failure` is set, an attachment that couldn't be
+        downloaded or analysed raises a :class:`RuntimeError` instead of
+        returning ``None``, so that callers can tell it from a skipped one.
+
+        Returns
+        -------
+        Optional[List[:class:`MatchCheck`]]
+            The exact matches of a newly inserted attachment, or ``None`` if
+            it was skipped, couldn't be processed or updated a record.
+        """
+        # Check if the attachment already exists in the database
+        exists = await self.check_attachment_exists(job)
+        if exists and not update_existing:
+            logger.info(f"└ Attachment {job.filename} already exists in the database.")
+            return
+
+        # Get the content type
+        if job.content_type is None:
+            logger.error(f"└ Attachment {job.filename} has an invalid content type")
+            return
+
+        # Download and process the image or video, keeping the downloaded
+        # file in the media cache until the analysis has finished
+        with self.media_cache.pinned(job.cache_key):
+            media = await self.download_attachment(job)
+            if media is None:
+                if raise_on_failure:
+                    raise RuntimeError(f"Failed to download {job.filename}")
+                return
+            analysis = await self.analyze_attachment(job, media, kind)
+            if analysis is None:
+                if raise_on_failure:
+                    raise RuntimeError(f"Failed to analyse {job.filename}")
+                return
+
+        return await self.store_media_record(
+            job, analysis, exists, update_existing, record_id
+        )
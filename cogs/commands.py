@@ -1,14 +1,14 @@
-import os
+import asyncio
 
-import aiofiles
 import disnake
 from disnake.ext import commands
 from loguru import logger
 
 import utils
 from bot import SauronBot
-from helpers import ImageProcessor, VideoProcessor
-from views import Paginator
+from database import IndexEntry, MediaInfo, ScrubJob
+from helpers import PipelineStats, analyze_image
+from views import Paginator, SearchResultsSource
 
 
 class Commands(commands.Cog):
@@ -17,72 +17,113 @@ class Commands(commands.Cog):
 
     async def download_media(self, url: str) -> str | None:
         try:
-            media_filename = os.path.basename(url).split("?")[0]
-            media_path = os.path.join(self.bot.temp_dir, media_filename)
+            key = self.bot.media_cache.key(url)
+            media_path = self.bot.media_cache.lookup(key)
 
-            if not os.path.exists(media_path):
+            if media_path is None:
                 async with self.bot.session.get(url) as response:
                     if response.status != 200:
                         logger.error(
                             f"Downloading media {url} returned status code `{response.status}`"
                         )
                         return None
-                    async with aiofiles.open(media_path, mode="wb") as f:
-                        await f.write(await response.read())
+                    media_path = await self.bot.save_to_media_cache(key, response)
             return media_path
         except Exception as err:
             logger.error(f"Downloading media returned invalid data! {err}")
             return None
 
     async def get_attachment_hash(self, attachment: disnake.Attachment) -> int:
-        file_path = os.path.join(self.bot.temp_dir, attachment.filename)
-        await attachment.save(fp=file_path, use_cached=True)
-
         content_type = utils.get_content_type(attachment)
         if content_type is None:
             raise ValueError(
                 f"Attachment {attachment.filename} has invalid content type {attachment.content_type}"
             )
 
-        # Process the image or video
-        if utils.is_image_content_type(content_type):
-            imageproc = ImageProcessor(file_path)
-            hash = imageproc.hash
-        elif utils.is_video_content_type(content_type):
-            try:
-                videoproc = VideoProcessor(file_path, self.bot.temp_dir)
-            except Exception as e:
-                raise ValueError(f"Failed to process video {attachment.filename}: {e}")
-            hash = videoproc.hash
-        else:
-            raise ValueError(
-                f"Attachment {attachment.filename} has invalid content type {attachment.content_type}"
-            )
+        # Reuse the hash of an attachment that was searched for recently
+        key = self.bot.media_cache.key(attachment.url)
+        hash_key = self.bot.search_cache.attachment_hash_key(key)
+        hash = self.bot.search_cache.get(hash_key)
+        if hash is not None:
+            return hash
 
+        hash = await self.compute_attachment_hash(attachment, content_type, key)
+        self.bot.search_cache.put(hash_key, hash)
         return hash
 
+    async def compute_attachment_hash(
+        self, attachment: disnake.Attachment, content_type: str, key: str
+    ) -> int:
+        # Keep the downloaded file in the media cache until it has been hashed
+        with self.bot.media_cache.pinned(key):
+            # Read small images into memory, and save everything else to disk
+            if (
+                utils.is_image_content_type(content_type)
+                and attachment.size <= self.bot.config.IN_MEMORY_MAX_BYTES
+            ):
+                media = await attachment.read(use_cached=True)
+            else:
+                media = self.bot.media_cache.lookup(key)
+                if media is None:
+                    media = self.bot.media_cache.path(key)
+                    await attachment.save(fp=media, use_cached=True)
+                    self.bot.media_cache.add(key)
+
+            # Reuse the analysis of byte-identical attachments
+            digest = await asyncio.to_thread(utils.content_digest, media)
+            analysis = await self.bot.get_cached_analysis(
+                digest, self.bot.analysis_mode(content_type)
+            )
+            if analysis is not None:
+                return analysis.hash
+
+            # Process the image or video, as promptly as a live message
+            if utils.is_image_content_type(content_type):
+                async with self.bot.analysis_scheduler.slot("live", None):
+                    analysis = await self.bot.run_analysis(
+                        analyze_image, media, ocr=False
+                    )
+            elif utils.is_video_content_type(content_type):
+                try:
+                    async with self.bot.analysis_scheduler.slot("live", None):
+                        analysis, _ = await self.bot.run_video_analysis(media)
+                except Exception as e:
+                    raise ValueError(
+                        f"Failed to process video {attachment.filename}: {e}"
+                    )
+            else:
+                raise ValueError(
+                    f"Attachment {attachment.filename} has invalid content type {attachment.content_type}"
+                )
+
+        return analysis.hash
+
     async def find_similar_images(
         self, hash: int, max_hamming_distance: int, guild_id: int
-    ) -> list[dict[str, str]]:
-        query = """
-            SELECT *
-            FROM media_fingerprints
-            WHERE hash <@ ($1, $2)
-            AND guild_id = $3;
-        """
-        matches = await self.bot.execute_query(
-            query, hash, max_hamming_distance, guild_id
+    ) -> list[int]:
+        key = self.bot.search_cache.similar_media_key(
+            guild_id, hash, max_hamming_distance
         )
-        return matches
+        record_ids = self.bot.search_cache.get(key)
+        if record_ids is None:
+            record_ids = self.bot.hash_index.search(
+                guild_id, hash, max_hamming_distance
+            )
+            self.bot.search_cache.put(key, record_ids)
+        return record_ids
 
     async def send_search_results(
         self,
         inter: disnake.ApplicationCommandInteraction,
-        matches: list[dict[str, str]],
+        record_ids: list[int],
         content: str = "",
         image_url: str = None,
+        truncated: bool = False,
     ):
-        if not matches:
+        count = f"`{len(record_ids)}`"
+        if truncated:
+            count = f"the best {count}"
+        if not record_ids:
             embed = disnake.Embed(
                 title="Search Results",
                 description="No similar images or videos found.",
@@ -91,55 +132,19 @@ class Commands(commands.Cog):
             if image_url:
                 embed.set_thumbnail(url=image_url)
             await inter.edit_original_response(
-                content=f"Found `{len(matches)}` results. {content}",
+                content=f"Found {count} results. {content}",
                 embed=embed,
             )
             return
 
-        matches.sort(key=lambda match: match["timestamp"])
-
-        embeds = []
-        message_urls = []
-        for i, match in enumerate(matches, 1):
-            user_mention = f"<@{match['author_id']}>"
-            if match["by_bot"]:
-                user_mention += f" via <@{match['bot_id']}>"
-            time_sent = f"<t:{int(match['timestamp'].timestamp())}:F>"
-            jump_url = f"https://discord.com/channels/{match['guild_id']}/{match['channel_id']}/{match['message_id']}"
-            if utils.is_image_content_type(match["content_type"]):
-                content_type_emoji = "🖼️"
-            elif utils.is_video_content_type(match["content_type"]):
-                content_type_emoji = "🎞️"
-            else:
-                content_type_emoji = "❓"
-
-            message_urls.append(
-                f"{i}. {jump_url} ({time_sent})\n  - Author: {user_mention}\n  - ID: {match['id']} | Type: {content_type_emoji}"
-            )
-            if i % 10 == 0:
-                embed = disnake.Embed(
-                    title="Search Results",
-                    description="\n".join(message_urls),
-                    color=disnake.Color.dark_orange(),
-                )
-                if image_url:
-                    embed.set_thumbnail(url=image_url)
-                embeds.append(embed)
-                message_urls = []
-        if message_urls:
-            embed = disnake.Embed(
-                title="Search Results",
-                description="\n".join(message_urls),
-                color=disnake.Color.dark_orange(),
-            )
-            if image_url:
-                embed.set_thumbnail(url=image_url)
-            embeds.append(embed)
-
-        paginator_view = Paginator(embeds, inter.author)
+        # Only the first page is fetched now, the rest when they are viewed
+        source = SearchResultsSource(self.bot, record_ids, image_url=image_url)
+        paginator_view = Paginator(source, inter.author)
+        if truncated:
+            content += "\nThere are more matches; refine the query to see them."
         message = await inter.edit_original_response(
-            content=f"Found `{len(matches)}` results. {content}",
-            embed=embeds[0],
+            content=f"Found {count} results. {content}",
+            embed=await paginator_view.get_page(0),
             view=paginator_view,
         )
         paginator_view.message = message
@@ -152,83 +157,20 @@ class Commands(commands.Cog):
         """Search for media based on text in the content."""
         await inter.response.defer()
 
-        # Find text matches in the database using trigram similarity
-        query = """
-            SELECT *
-            FROM media_fingerprints
-            WHERE text_ocr % $1
-            AND guild_id = $2
-            ORDER BY text_ocr <-> $1;
-        """
-        ocr_trigram_matches = await self.bot.execute_query(
-            query, f"%{text}%", inter.guild.id
-        )
-
-        # Find text matches in the database using full text search
-        # query = """
-        #     SELECT *
-        #     FROM media_fingerprints
-        #     WHERE text_ocr_vector @@ to_tsquery('english', $1)
-        #     AND guild_id = $2
-        #     ORDER BY ts_rank_cd(text_ocr_vector, to_tsquery('english', $1)) DESC;
-        # """
-        query = """
-            SELECT *
-            FROM media_fingerprints
-            WHERE text_ocr_vector @@ plainto_tsquery('english', $1)
-            AND guild_id = $2
-            ORDER BY ts_rank_cd(text_ocr_vector, plainto_tsquery('english', $1)) DESC;
-        """
-        ocr_fts_matches = await self.bot.execute_query(
-            query, f"%{text}%", inter.guild.id
-        )
-
-        # Find text matches in the database using trigram similarity
-        query = """
-            SELECT *
-            FROM media_fingerprints
-            WHERE video_transcription % $1
-            AND guild_id = $2
-            ORDER BY video_transcription <-> $1;
-        """
-        transcript_trigram_matches = await self.bot.execute_query(
-            query, f"%{text}%", inter.guild.id
-        )
-
-        # Find text matches in the database using full text search
-        query = """
-            SELECT *
-            FROM media_fingerprints
-            WHERE video_transcription_vector @@ plainto_tsquery('english', $1)
-            AND guild_id = $2
-            ORDER BY ts_rank_cd(video_transcription_vector, plainto_tsquery('english', $1)) DESC;
-        """
-        transcript_fts_matches = await self.bot.execute_query(
-            query, f"%{text}%", inter.guild.id
-        )
-
-        logger.debug(f"ocr_trigram_matches: {len(ocr_trigram_matches)}")
-        logger.debug(f"ocr_fts_matches: {len(ocr_fts_matches)}")
-        logger.debug(f"transcript_trigram_matches: {len(transcript_trigram_matches)}")
-        logger.debug(f"transcript_fts_matches: {len(transcript_fts_matches)}")
-
-        # Combine the lists of matches
-        matches = []
-        for match in ocr_trigram_matches:
-            if match not in matches:
-                matches.append(match)
-        for match in ocr_fts_matches:
-            if match not in matches:
-                matches.append(match)
-        for match in transcript_trigram_matches:
-            if match not in matches:
-                matches.append(match)
-        for match in transcript_fts_matches:
-            if match not in matches:
-                matches.append(match)
+        # Fetch one match over the limit to tell whether there are more
+        limit = self.bot.config.SEARCH_RESULT_LIMIT
+        key = self.bot.search_cache.text_key(inter.guild.id, text)
+        matches = self.bot.search_cache.get(key)
+        if matches is None:
+            matches = await self.bot.find_text_matches(text, inter.guild.id, limit + 1)
+            self.bot.search_cache.put(key, matches)
+        truncated = len(matches) > limit
+        matches = matches[:limit]
         logger.info(f"Found {len(matches)} similar media for query: '{text}'.")
 
-        await self.send_search_results(inter, matches, content=f"Query:\n> {text}")
+        await self.send_search_results(
+            inter, matches, content=f"Query:\n> {text}", truncated=truncated
+        )
         return
 
     @commands.slash_command()
@@ -249,10 +191,6 @@ class Commands(commands.Cog):
         """
         await inter.response.defer()
 
-        file_path = os.path.join(self.bot.temp_dir, attachment.filename)
-        await attachment.save(fp=file_path, use_cached=True)
-        logger.info(f"Saved attachment {attachment.filename} to {file_path}")
-
         hash = await self.get_attachment_hash(attachment)
         logger.info(f"Hash: {hash}")
 
@@ -330,12 +268,6 @@ class Commands(commands.Cog):
             return
         attachment = message.attachments[attachment_index - 1]
 
-        file_path = os.path.join(self.bot.temp_dir, attachment.filename)
-        await attachment.save(fp=file_path, use_cached=True)
-        logger.info(
-            f"Saved attachment {attachment.filename} from message {message.id} to {file_path}"
-        )
-
         hash = await self.get_attachment_hash(attachment)
         logger.info(f"Hash: {hash}")
 
@@ -356,24 +288,24 @@ class Commands(commands.Cog):
         """View database information about an message."""
         await inter.response.defer(ephemeral=True)
 
-        query = """
-            SELECT *
+        query = f"""
+            SELECT {MediaInfo.COLUMNS}
             FROM media_fingerprints
             WHERE message_id = $1
             AND channel_id = $2
             AND guild_id = $3;
         """
-        result = await self.bot.execute_query(
-            query, message.id, message.channel.id, message.guild.id
+        result = await self.bot.fetch_records(
+            MediaInfo, query, message.id, message.channel.id, message.guild.id
         )
         if not result:
             await inter.edit_original_response("No database record(s) found.")
             return
 
         record = result[0]
-        user_mention = f"<@{record['author_id']}>"
-        time_sent = f"<t:{int(record['timestamp'].timestamp())}:F>"
-        jump_url = f"https://discord.com/channels/{record['guild_id']}/{record['channel_id']}/{record['message_id']}"
+        user_mention = f"<@{record.author_id}>"
+        time_sent = f"<t:{int(record.timestamp.timestamp())}:F>"
+        jump_url = record.jump_url
 
         embed = disnake.Embed(
             title="Message DB Info",
@@ -397,15 +329,17 @@ class Commands(commands.Cog):
         """Delete a record from the database."""
         await inter.response.defer(ephemeral=True)
 
-        query = """
+        query = f"""
             DELETE FROM media_fingerprints
             WHERE message_id = $1
             AND channel_id = $2
-            AND guild_id = $3;
+            AND guild_id = $3
+            RETURNING {IndexEntry.COLUMNS};
         """
-        await self.bot.execute_query(
-            query, message.id, message.channel.id, message.guild.id
+        deleted_records = await self.bot.fetch_records(
+            IndexEntry, query, message.id, message.channel.id, message.guild.id
         )
+        self.bot.unindex_records(deleted_records)
 
         await inter.edit_original_response("Record deleted.")
 
@@ -416,10 +350,14 @@ class Commands(commands.Cog):
         self,
         inter: disnake.ApplicationCommandInteraction,
     ):
-        """Clear the files from the bot's temporary directory."""
+        """Clear the downloaded media and the cached search results of the bot."""
         await inter.response.defer()
-        self.bot.clear_temp_dir()
-        await inter.edit_original_response("Cleared temporary directory.")
+        evicted = self.bot.media_cache.clear()
+        self.bot.search_cache.clear()
+        await inter.edit_original_response(
+            f"Cleared `{evicted}` files from the media cache. ({self.bot.media_cache})\n"
+            f"Cleared the search cache. ({self.bot.search_cache})"
+        )
 
     @commands.slash_command(
         default_member_permissions=disnake.Permissions(administrator=True)
@@ -440,7 +378,7 @@ class Commands(commands.Cog):
         channel: `disnake.TextChannel`
             A monitored channel.
         starting_message: `disnake.Message`
-            Requires oldest_first to be True.
+            The first message to scrub, going in the direction of oldest_first.
         limit: `int`
             Default: None.
         oldest_first: `bool`
@@ -453,52 +391,138 @@ class Commands(commands.Cog):
         if channel.id not in self.bot.config.MONITORED_CHANNELS:
             await inter.edit_original_response("Channel is not monitored.")
             return
-        if starting_message and not oldest_first:
-            await inter.edit_original_response(
-                "`starting_message` requires `oldest_first` to be `True`."
-            )
-            return
         if starting_message and starting_message.channel != channel:
             await inter.edit_original_response(
                 "Starting message is not within the selected channel."
             )
             return
 
+        # The starting message itself is scrubbed, so the cursor is just
+        # outside of it, in the direction the history is read
+        cursor = None
+        if starting_message:
+            cursor = starting_message.id + (-1 if oldest_first else 1)
+        job = await self.bot.create_scrub_job(
+            channel, oldest_first, update_existing, limit, cursor
+        )
         original_message = await inter.edit_original_response(
-            f"Scrubbing {channel.mention}..."
+            f"Scrubbing {channel.mention}... (scrub `#{job.id}`)"
         )
+        await self.follow_scrub(job, original_message)
 
-        starting_message_found = False
-        message_count = 1
-        async for message in channel.history(limit=limit, oldest_first=oldest_first):
-            if starting_message and not starting_message_found:
-                if message.id >= starting_message.id:
-                    starting_message_found = True
-                else:
-                    continue
-            if not message.attachments:
-                continue
-
-            if message_count % 100 == 0:
-                original_message = await original_message.channel.fetch_message(
-                    original_message.id
-                )
-                await original_message.edit(
-                    f"Scrubbed {message_count} messages. Clearing cache..."
-                )
-                self.bot.clear_temp_dir()
+    async def follow_scrub(self, job: ScrubJob, original_message: disnake.Message):
+        """Run a scrub, reporting its progress by editing a message."""
+        channel_mention = f"<#{job.channel_id}>"
 
-            for attachment_index in range(len(message.attachments)):
-                await self.bot.insert_media_record(
-                    message, attachment_index, update_existing=update_existing
-                )
+        async def report_progress(stats: PipelineStats):
+            nonlocal original_message
+            original_message = await original_message.channel.fetch_message(
+                original_message.id
+            )
+            await original_message.edit(
+                f"Scrubbing {channel_mention}... (scrub `#{job.id}`)\n```\n{stats}\n```"
+            )
 
-            message_count += 1
+        task = self.bot.start_scrub_job(job, on_progress=report_progress)
+        await asyncio.wait({task})
 
         original_message = await original_message.channel.fetch_message(
             original_message.id
         )
-        await original_message.edit(f"Finished scrubbing {message_count} messages.")
+        if task.cancelled():
+            await original_message.edit(
+                f"Paused scrub `#{job.id}` of {channel_mention}. Use `/resume_scrub` to continue it."
+            )
+        elif task.exception() is not None:
+            await original_message.edit(
+                f"Scrub `#{job.id}` of {channel_mention} failed: {task.exception()}"
+            )
+        else:
+            stats = task.result()
+            await original_message.edit(
+                f"Finished scrubbing {stats.counts['messages']} messages of {channel_mention} in {stats.elapsed:.0f}s. (scrub `#{job.id}`)\n```\n{stats}\n```"
+            )
+
+    @commands.slash_command(
+        default_member_permissions=disnake.Permissions(administrator=True)
+    )
+    async def list_scrubs(self, inter: disnake.ApplicationCommandInteraction):
+        """List the full scrubs of this server and their progress."""
+        await inter.response.defer(ephemeral=True)
+
+        jobs = await self.bot.get_scrub_jobs(inter.guild.id)
+        if not jobs:
+            await inter.edit_original_response("No scrubs found.")
+            return
+
+        lines = []
+        for job in jobs[:20]:
+            updated = f"<t:{int(job.updated_at.timestamp())}:R>"
+            lines.append(
+                f"`#{job.id}` <#{job.channel_id}> **{job.status}** (updated {updated})\n"
+                f"  - Messages: {job.messages_scanned} | Written: {job.written} | Skipped: {job.skipped} | Failed: {job.failed}"
+            )
+        embed = disnake.Embed(
+            title="Scrubs",
+            description="\n".join(lines),
+            color=disnake.Color.dark_orange(),
+        )
+        await inter.edit_original_response(embed=embed)
+
+    @commands.slash_command(
+        default_member_permissions=disnake.Permissions(administrator=True)
+    )
+    async def pause_scrub(
+        self, inter: disnake.ApplicationCommandInteraction, scrub_id: int
+    ):
+        """Pause a running scrub at its last checkpoint.
+
+        Parameters
+        ----------
+        scrub_id: `int`
+            The scrub to pause, as shown by /list_scrubs.
+        """
+        await inter.response.defer(ephemeral=True)
+
+        jobs = await self.bot.get_scrub_jobs(inter.guild.id)
+        task = self.bot.scrub_tasks.get(scrub_id)
+        if task is None or scrub_id not in [job.id for job in jobs]:
+            await inter.edit_original_response(f"Scrub `#{scrub_id}` is not running.")
+            return
+
+        task.cancel()
+        await asyncio.wait({task})
+        await inter.edit_original_response(f"Paused scrub `#{scrub_id}`.")
+
+    @commands.slash_command(
+        default_member_permissions=disnake.Permissions(administrator=True)
+    )
+    async def resume_scrub(
+        self, inter: disnake.ApplicationCommandInteraction, scrub_id: int
+    ):
+        """Resume a paused or failed scrub from its last checkpoint.
+
+        Parameters
+        ----------
+        scrub_id: `int`
+            The scrub to resume, as shown by /list_scrubs.
+        """
+        await inter.response.defer()
+
+        jobs = await self.bot.get_scrub_jobs(
+            inter.guild.id, ["paused", "failed", "running"]
+        )
+        job = next((job for job in jobs if job.id == scrub_id), None)
+        if job is None or scrub_id in self.bot.scrub_tasks:
+            await inter.edit_original_response(
+                f"Scrub `#{scrub_id}` can't be resumed, it is either running or finished."
+            )
+            return
+
+        original_message = await inter.edit_original_response(
+            f"Resuming scrub `#{job.id}` of <#{job.channel_id}> after {job.messages_scanned} messages..."
+        )
+        await self.follow_scrub(job, original_message)
 
 
 def setup(bot: commands.Bot):
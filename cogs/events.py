@@ -2,8 +2,10 @@ import asyncio
 
 import disnake
 from disnake.ext import commands
+from loguru import logger
 
-from bot import SauronBot
+from bot import REPOST_EMOJI, SauronBot
+from helpers import AttachmentJob
 
 
 class Events(commands.Cog):
@@ -18,18 +20,37 @@ class Events(commands.Cog):
         if not message.attachments:
             return
 
-        add_reaction = False
+        # Leave the attachments to the ingestion workers, which report
+        # reposts back to the bot
+        self.bot.live_watermarks.start(message.channel.id, message.id)
+        if self.bot.config.INGESTION_QUEUE:
+            jobs = [
+                AttachmentJob.from_message(message, attachment_index)
+                for attachment_index in range(len(message.attachments))
+            ]
+            try:
+                await self.bot.enqueue_attachments(jobs, "live")
+            except Exception:
+                await self.fail_watermark(message)
+                raise
+            await self.advance_watermark(message)
+            return
 
-        # Process each attachment
-        for attachment_index in range(len(message.attachments)):
-            matches = await self.bot.insert_media_record(message, attachment_index)
-            if len(matches) > 0:
-                add_reaction = True
+        # Process the attachments concurrently, reacting as soon as any of
+        # them turns out to be a repost
+        semaphore = asyncio.Semaphore(self.bot.config.MESSAGE_ATTACHMENT_CONCURRENCY)
+        reacted = False
 
-        # Add a reaction to the message if a repost was detected
-        if add_reaction:
-            await asyncio.sleep(1)
-            await message.add_reaction("<:REPOST:1212160642002194472>")
+        async def process_attachment(attachment_index: int):
+            nonlocal reacted
+            async with semaphore:
+                matches = await self.bot.insert_media_record(
+                    message, attachment_index, raise_on_failure=True
+                )
+            if not matches or reacted:
+                return
+            reacted = True
+            await message.add_reaction(REPOST_EMOJI)
 
             # TODO add toggle for sending reply message
             # message_urls = []
@@ -47,6 +68,52 @@ class Events(commands.Cog):
             # ).set_thumbnail(url=attachment.url)
             # await message.reply(embed=embed)
 
+        results = await asyncio.gather(
+            *(
+                process_attachment(attachment_index)
+                for attachment_index in range(len(message.attachments))
+            ),
+            return_exceptions=True,
+        )
+        failed = False
+        for attachment_index, result in enumerate(results):
+            if isinstance(result, Exception):
+                failed = True
+                logger.opt(exception=result).error(
+                    f"Failed to process attachment {attachment_index} of {message.jump_url}: {result}"
+                )
+
+        if failed:
+            await self.fail_watermark(message)
+        else:
+            await self.advance_watermark(message)
+
+    async def advance_watermark(self, message: disnake.Message):
+        """Move the watermark of a channel up to an ingested message.
+
+        It only moves once the backlog before the message is in, and never
+        past an older message that is still being ingested.
+        """
+        watermark = self.bot.live_watermarks.finish(message.channel.id, message.id)
+        if watermark is None or message.channel.id not in self.bot.caught_up_channels:
+            return
+        await self.bot.advance_channel_watermark(
+            message.guild.id, message.channel.id, watermark
+        )
+
+    async def fail_watermark(self, message: disnake.Message):
+        """Keep the watermark of a channel before a message that failed.
+
+        The channel no longer advances its watermark on new messages, until
+        the next catch-up ingests the failed message again.
+        """
+        self.bot.live_watermarks.fail(message.channel.id, message.id)
+        if message.channel.id in self.bot.caught_up_channels:
+            self.bot.caught_up_channels.discard(message.channel.id)
+            logger.warning(
+                f"Holding the watermark of channel {message.channel.id} until the next catch-up."
+            )
+
     @commands.Cog.listener()
     async def on_message_edit(self, before: disnake.Message, after: disnake.Message):
         """Called when a Message receives an update event.
@@ -1,25 +1,40 @@
+import asyncio
+
+import disnake
 from disnake.ext import commands, tasks
 from loguru import logger
 
 from bot import SauronBot
+from helpers import AttachmentJob
 
 
 class Tasks(commands.Cog):
     def __init__(self, bot: SauronBot):
         self.bot = bot
-        self.clean_temp_dir.start()
+        self.evict_media_cache.start()
         self.check_for_media.start()
+        self.evict_analysis_cache.start()
+        self.report_search_cache.start()
+        self.report_ingestion_schedulers.start()
+        self.resume_scrubs.start()
 
     @tasks.loop(hours=1.0)
-    async def clean_temp_dir(self):
-        """Clears all files from the bot's temporary directory."""
-        if self.clean_temp_dir.current_loop == 0:
-            return
-        logger.debug(
-            f"Cleaning temp directory... [loop #{self.clean_temp_dir.current_loop}]"
-        )
-        self.bot.clear_temp_dir()
-        logger.info("Finished clearing temp directory.")
+    async def evict_media_cache(self):
+        """Evicts unpinned files from the media cache that are over its budget."""
+        evicted = self.bot.media_cache.evict()
+        logger.info(f"Media cache: {self.bot.media_cache} ({evicted} evicted now).")
+
+    @tasks.loop(count=1)
+    async def resume_scrubs(self):
+        """Resumes the scrubs that were running when the bot last stopped."""
+        jobs = await self.bot.get_scrub_jobs(statuses=["running"])
+        for job in jobs:
+            if job.id in self.bot.scrub_tasks:
+                continue
+            logger.info(
+                f"Resuming scrub {job.id} of channel {job.channel_id} after {job.messages_scanned} messages."
+            )
+            self.bot.start_scrub_job(job)
 
     @tasks.loop(hours=1.0)
     async def check_for_media(self):
@@ -27,29 +42,123 @@ class Tasks(commands.Cog):
             f"Checking for absent media... [loop #{self.check_for_media.current_loop}]"
         )
 
-        query = """
-            SELECT MAX(timestamp) AS latest_timestamp
-            FROM media_fingerprints;
+        channel_ids = self.bot.config.MONITORED_CHANNELS
+        watermarks = await self.bot.get_channel_watermarks(channel_ids)
+
+        # Catch up on every channel from its own watermark, a few at a time
+        semaphore = asyncio.Semaphore(self.bot.config.CATCH_UP_WORKERS)
+
+        async def catch_up(channel_id: int):
+            async with semaphore:
+                try:
+                    await self.catch_up_channel(channel_id, watermarks.get(channel_id))
+                except Exception as e:
+                    logger.exception(f"Failed to catch up channel {channel_id}: {e}")
+
+        await asyncio.gather(*(catch_up(channel_id) for channel_id in channel_ids))
+        logger.info("Finished checking for absent media.")
+
+    async def catch_up_channel(self, channel_id: int, last_message_id: int | None):
+        """Ingest the messages of a channel posted after its watermark.
+
+        Messages are read oldest first and the watermark is advanced as they
+        are ingested, so an interrupted catch-up resumes where it stopped.
+        The watermark stops before the first message that fails, and the
+        channel is caught up again at the next check.
         """
-        result = await self.bot.execute_query(query)
-        if not result:
+        channel = await self.bot.fetch_channel(channel_id)
+        if last_message_id is None:
+            logger.warning(
+                f"Channel {channel.name}[{channel.id}] has no ingested messages, run a full scrub to ingest it."
+            )
+            self.bot.caught_up_channels.add(channel.id)
             return
-        latest_timestamp = result[0]["latest_timestamp"]
 
-        for channel_id in self.bot.config.MONITORED_CHANNELS:
-            channel = await self.bot.fetch_channel(channel_id)
-            logger.info(f"Searching channel {channel.name}[{channel.id}] for media...")
-            async for message in channel.history(limit=None, after=latest_timestamp):
-                if not message.attachments:
-                    continue
+        logger.info(f"Searching channel {channel.name}[{channel.id}] for media...")
+        scanned = 0
+        ingested = 0
+        failed = 0
+        async for message in channel.history(
+            limit=None, after=disnake.Object(id=last_message_id), oldest_first=True
+        ):
+            if message.attachments:
+                if self.bot.config.INGESTION_QUEUE:
+                    jobs = [
+                        AttachmentJob.from_message(message, attachment_index)
+                        for attachment_index in range(len(message.attachments))
+                    ]
+                    await self.bot.enqueue_attachments(jobs, "catch_up")
+                else:
+                    for attachment_index in range(len(message.attachments)):
+                        try:
+                            await self.bot.insert_media_record(
+                                message,
+                                attachment_index,
+                                kind="catch_up",
+                                raise_on_failure=True,
+                            )
+                        except Exception as e:
+                            logger.exception(
+                                f"Failed to catch up attachment {attachment_index} of {message.jump_url}: {e}"
+                            )
+                            failed += 1
+                ingested += 1
+            scanned += 1
+            if failed:
+                continue
+            last_message_id = message.id
 
-                for attachment_index in range(len(message.attachments)):
-                    await self.bot.insert_media_record(message, attachment_index)
+            # Checkpoint after every message with attachments, which are
+            # the slow ones, and every so often while skipping the others
+            if message.attachments or scanned % 50 == 0:
+                await self.bot.advance_channel_watermark(
+                    channel.guild.id, channel.id, last_message_id
+                )
 
-        logger.info("Finished checking for absent media.")
+        await self.bot.advance_channel_watermark(
+            channel.guild.id, channel.id, last_message_id
+        )
+        if failed:
+            logger.warning(
+                f"Failed to catch up {failed} attachments of channel {channel.name}[{channel.id}], retrying at the next check."
+            )
+            return
+        self.bot.caught_up_channels.add(channel.id)
+        logger.info(
+            f"Caught up channel {channel.name}[{channel.id}] ({ingested} messages with media)."
+        )
+
+    @tasks.loop(hours=1.0)
+    async def evict_analysis_cache(self):
+        """Evicts old entries from the analysis cache and reports its hit rate."""
+        evicted = await self.bot.evict_analysis_cache()
+        hits = self.bot.analysis_cache_hits
+        misses = self.bot.analysis_cache_misses
+        hit_rate = hits / (hits + misses) if hits + misses else 0.0
+        logger.info(
+            f"Analysis cache: {hits} hits, {misses} misses ({hit_rate:.1%} hit rate), {evicted} evicted."
+        )
+
+    @tasks.loop(hours=1.0)
+    async def report_ingestion_schedulers(self):
+        """Logs how long each class of ingestion jobs waits for a worker."""
+        logger.info(f"Analysis scheduler: {self.bot.analysis_scheduler}")
+        if self.bot.transcription_scheduler is not None:
+            logger.info(f"Transcription scheduler: {self.bot.transcription_scheduler}")
+        if self.bot.florence is not None:
+            logger.info(f"Florence-2 OCR: {self.bot.florence}")
+
+    @tasks.loop(hours=1.0)
+    async def report_search_cache(self):
+        """Reports the hit rate of the search result cache."""
+        logger.info(f"Search cache: {self.bot.search_cache}")
 
-    @clean_temp_dir.before_loop
+    @evict_media_cache.before_loop
     @check_for_media.before_loop
+    @evict_analysis_cache.before_loop
+    @report_search_cache.before_loop
+    @report_ingestion_schedulers.before_loop
+    @resume_scrubs.before_loop
     async def wait_before_tasks(self):
         await self.bot.wait_until_ready()
 
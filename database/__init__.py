@@ -0,0 +1,9 @@
+from .records import (
+    IndexEntry,
+    MatchCheck,
+    MediaInfo,
+    QueuedAttachment,
+    Record,
+    ScrubJob,
+    SearchHit,
+)
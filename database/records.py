@@ -0,0 +1,167 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import ClassVar, Iterable, Self
+
+import asyncpg
+
+# Every record type is a named projection of `media_fingerprints`: `COLUMNS`
+# is the select list of the query, in the same order as the fields, so rows
+# can be unpacked positionally without looking up columns by name.
+
+
+class Record:
+    """Base class of the typed rows returned by database queries."""
+
+    __slots__ = ()
+
+    COLUMNS: ClassVar[str]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[asyncpg.Record]) -> list[Self]:
+        return [cls(*row) for row in rows]
+
+    def items(self) -> list[tuple[str, object]]:
+        return [(field.name, getattr(self, field.name)) for field in fields(self)]
+
+
+class _MessageLink:
+    __slots__ = ()
+
+    guild_id: int
+    channel_id: int
+    message_id: int
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
+
+
+@dataclass(slots=True, frozen=True)
+class IndexEntry(Record):
+    """The fields of a record needed by the in-memory hash index."""
+
+    COLUMNS: ClassVar[str] = "id, guild_id, hash"
+
+    id: int
+    guild_id: int
+    hash: int | None
+
+
+@dataclass(slots=True, frozen=True)
+class MatchCheck(_MessageLink, Record):
+    """A previous post of an attachment, found while checking for reposts."""
+
+    COLUMNS: ClassVar[str] = (
+        "id, timestamp, guild_id, channel_id, message_id, author_id"
+    )
+
+    id: int
+    timestamp: datetime
+    guild_id: int
+    channel_id: int
+    message_id: int
+    author_id: int
+
+
+@dataclass(slots=True, frozen=True)
+class SearchHit(_MessageLink, Record):
+    """A search result, with just enough to list and link to it."""
+
+    COLUMNS: ClassVar[str] = (
+        "id, timestamp, guild_id, channel_id, message_id, author_id, by_bot, bot_id, "
+        "content_type"
+    )
+
+    id: int
+    timestamp: datetime
+    guild_id: int
+    channel_id: int
+    message_id: int
+    author_id: int
+    by_bot: bool
+    bot_id: int | None
+    content_type: str
+
+
+@dataclass(slots=True, frozen=True)
+class MediaInfo(_MessageLink, Record):
+    """Every stored field of a record, except the full text search vectors."""
+
+    COLUMNS: ClassVar[str] = (
+        "id, hash, text_ocr, video_transcription, content_type, filename, "
+        "attachment_index, url, timestamp, guild_id, channel_id, message_id, "
+        "author_id, by_bot, bot_id"
+    )
+
+    id: int
+    hash: int | None
+    text_ocr: str | None
+    video_transcription: str | None
+    content_type: str
+    filename: str
+    attachment_index: int
+    url: str
+    timestamp: datetime
+    guild_id: int
+    channel_id: int
+    message_id: int
+    author_id: int
+    by_bot: bool
+    bot_id: int | None
+
+
+@dataclass(slots=True, frozen=True)
+class ScrubJob(Record):
+    """A full scrub of a channel, and its progress up to the last checkpoint."""
+
+    COLUMNS: ClassVar[str] = (
+        "id, guild_id, channel_id, status, oldest_first, update_existing, "
+        "message_limit, cursor_message_id, messages_scanned, written, skipped, "
+        "failed, updated_at"
+    )
+
+    id: int
+    guild_id: int
+    channel_id: int
+    status: str
+    oldest_first: bool
+    update_existing: bool
+    message_limit: int | None
+    cursor_message_id: int | None
+    messages_scanned: int
+    written: int
+    skipped: int
+    failed: int
+    updated_at: datetime
+
+
+@dataclass(slots=True, frozen=True)
+class QueuedAttachment(Record):
+    """An attachment claimed from the ingestion queue by a worker.
+
+    The fields after `update_existing` are those of an `AttachmentJob`, in
+    the same order.
+    """
+
+    COLUMNS: ClassVar[str] = (
+        "id, kind, attempts, update_existing, guild_id, channel_id, message_id, "
+        "attachment_index, filename, url, size, content_type, timestamp, author_id, "
+        "by_bot, bot_id"
+    )
+
+    id: int
+    kind: str
+    attempts: int
+    update_existing: bool
+    guild_id: int
+    channel_id: int
+    message_id: int
+    attachment_index: int
+    filename: str
+    url: str
+    size: int
+    content_type: str | None
+    timestamp: datetime
+    author_id: int
+    by_bot: bool
+    bot_id: int | None
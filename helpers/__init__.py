@@ -1,2 +1,37 @@
-from .image import ImageProcessor
-from .video import VideoProcessor
+import importlib
+
+from .decode import VideoDecoder, load_audio, probe_video
+from .transcriber import Transcription
+from .analysis import (
+    MediaAnalysis,
+    analyze_image,
+    analyze_video,
+    extract_image_text,
+    init_analysis_worker,
+    transcribe_video,
+)
+from .hash_index import HashIndex
+from .media_cache import MediaCache
+from .search_cache import SearchCache
+from .pipeline import AttachmentJob, IngestionPipeline, PipelineStats
+from .scheduler import IngestionScheduler
+from .watermarks import WatermarkTracker
+from .ingestion_worker import IngestionWorker
+from .florence import CircuitBreaker, FlorenceClient
+
+# The media processors pull in OpenCV, Tesseract and the hashing libraries,
+# so they are only imported on first access
+_LAZY_EXPORTS = {
+    "ImageProcessor": ".image",
+    "FrameHasher": ".video",
+    "VideoProcessor": ".video",
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
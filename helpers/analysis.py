@@ -0,0 +1,129 @@
+from collections import namedtuple
+
+import numpy as np
+
+from . import transcriber
+from .decode import VideoDecoder, load_audio, probe_video
+from .transcriber import Transcription
+
+# The image and video processors pull in OpenCV, Tesseract and the hashing
+# libraries, which only the analysis workers need. They are imported by the
+# entrypoints below, so the bot itself never loads them.
+
+# The result of analysing a single attachment. Every field is a plain Python
+# value so that it can be pickled back from a worker process.
+MediaAnalysis = namedtuple(
+    "MediaAnalysis",
+    [
+        "hash",
+        "text_ocr",
+        "video_transcription",
+    ],
+)
+
+# Videos longer than this many seconds are not transcribed
+MAX_TRANSCRIPTION_SECS = 600
+
+
+def init_analysis_worker(
+    ocr_backend: str,
+    min_text_regions: int,
+    tesseract_cmd: str,
+    max_text_region_height: float,
+) -> None:
+    """Process pool initializer that applies the OCR settings of the bot."""
+    from . import ocr
+
+    ocr.configure(ocr_backend, min_text_regions, tesseract_cmd, max_text_region_height)
+
+
+def analyze_image(source: str | bytes, ocr: bool = True) -> MediaAnalysis:
+    """Hash and (optionally) OCR an image from a file path or its bytes.
+
+    This is the entrypoint executed inside the analysis process pool, so it
+    must stay a module-level function.
+    """
+    from .image import ImageProcessor
+
+    imageproc = ImageProcessor(source)
+    text_ocr = imageproc.ocr() if ocr else None
+    return MediaAnalysis(imageproc.hash, text_ocr, None)
+
+
+def extract_image_text(source: str | bytes) -> str:
+    """OCR an image with Tesseract, from a file path or its bytes.
+
+    This is the entrypoint executed inside the analysis process pool when
+    Florence-2 is unavailable or raced against Tesseract.
+    """
+    from .image import ImageProcessor
+
+    return ImageProcessor(source).ocr()
+
+
+def analyze_video(
+    path: str,
+    storage_path: str,
+    single_pass: bool = True,
+    sample_fps: float = 1.0,
+    frame_size: int = 640,
+    ocr: bool = False,
+    ocr_time_budget: float | None = None,
+    with_audio: bool = False,
+) -> tuple[MediaAnalysis, np.ndarray | None]:
+    """Hash and (optionally) OCR a video.
+
+    With `single_pass`, the video is decoded exactly once: sampled frames are
+    fed to the hasher and to OCR as they are decoded, and, if `with_audio` is
+    set, the audio track is returned alongside the analysis as a 16 kHz mono
+    waveform ready for :func:`transcribe_video`. Otherwise, the legacy
+    :class:`VideoProcessor` is used and no audio is returned.
+
+    This is the entrypoint executed inside the analysis process pool, so it
+    must stay a module-level function.
+    """
+    from .video import FrameHasher, VideoProcessor, ocr_frames
+
+    if not single_pass:
+        videoproc = VideoProcessor(path, storage_path)
+        text_ocr = videoproc.ocr(sample_fps, ocr_time_budget) if ocr else None
+        return MediaAnalysis(videoproc.hash, text_ocr, None), None
+
+    duration, has_audio = probe_video(path)
+    decoder = VideoDecoder(
+        path,
+        sample_fps=sample_fps,
+        frame_size=frame_size,
+        audio=with_audio and has_audio and duration <= MAX_TRANSCRIPTION_SECS,
+    )
+    hasher = FrameHasher()
+
+    def frames():
+        for frame in decoder:
+            hasher.update(frame)
+            yield frame
+
+    # OCR may stop early, but every frame is still needed for the hash
+    sampled_frames = frames()
+    text_ocr = ocr_frames(sampled_frames, ocr_time_budget) if ocr else None
+    for _ in sampled_frames:
+        pass
+
+    return MediaAnalysis(hasher.hash, text_ocr, None), decoder.audio
+
+
+def transcribe_video(
+    source: str | np.ndarray, model_name: str = "base"
+) -> Transcription:
+    """Transcribe a video from its path, or from its already decoded audio.
+
+    This is the entrypoint executed inside the transcription process pool,
+    whose workers keep the Whisper model loaded between jobs.
+    """
+    if isinstance(source, np.ndarray):
+        audio = source
+    else:
+        audio = load_audio(source, max_duration=MAX_TRANSCRIPTION_SECS)
+    if audio is None or audio.size == 0:
+        return Transcription("", 0.0, 0.0)
+    return transcriber.transcribe(audio, model_name)
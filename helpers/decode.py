@@ -0,0 +1,193 @@
+import json
+import os
+import subprocess
+import threading
+from collections.abc import Iterator
+
+import numpy as np
+from loguru import logger
+
+# Whisper expects 16 kHz mono audio
+AUDIO_SAMPLE_RATE = 16000
+
+
+def probe_video(path: str) -> tuple[float, bool]:
+    """Read the duration of a video and whether it has an audio stream.
+
+    Only the container headers are read, so this is much cheaper than
+    decoding any of the streams.
+
+    Returns
+    -------
+    Tuple[:class:`float`, :class:`bool`]
+        The duration in seconds (``0.0`` if unknown) and whether the video has
+        at least one audio stream.
+    """
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration:stream=codec_type",
+        "-of",
+        "json",
+        path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    info = json.loads(result.stdout)
+    duration = float(info.get("format", {}).get("duration") or 0.0)
+    has_audio = any(
+        stream.get("codec_type") == "audio" for stream in info.get("streams", [])
+    )
+    return duration, has_audio
+
+
+def load_audio(path: str, max_duration: float | None = None) -> np.ndarray | None:
+    """Decode the audio track of a video for Whisper.
+
+    ffmpeg downmixes and resamples the first audio stream to 16 kHz mono
+    ``float32`` samples and pipes them straight into memory, so no
+    intermediate file is written and Whisper doesn't need to resample.
+
+    Returns ``None`` if the video has no audio stream, or if it is longer
+    than `max_duration` seconds.
+    """
+    duration, has_audio = probe_video(path)
+    if not has_audio:
+        logger.debug(f"No audio stream in {path}, skipping audio decoding")
+        return None
+    if max_duration is not None and duration > max_duration:
+        logger.debug(f"{path} is longer than {max_duration}s, skipping audio decoding")
+        return None
+
+    cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-nostdin",
+        "-i",
+        path,
+        "-map",
+        "0:a:0",
+        "-ac",
+        "1",
+        "-ar",
+        str(AUDIO_SAMPLE_RATE),
+        "-f",
+        "f32le",
+        "pipe:1",
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        stderr = result.stderr.decode(errors="replace").strip()
+        logger.warning(f"ffmpeg exited with code {result.returncode}: {stderr}")
+        return None
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+class VideoDecoder:
+    """Decode a video once, sampling frames and (optionally) its audio.
+
+    A single ffmpeg process decodes the file: sampled video frames are piped
+    to stdout as raw BGR images, while the audio track is resampled to 16 kHz
+    mono PCM and piped through a second file descriptor. Iterating over the
+    decoder yields the frames; once they are exhausted, :attr:`audio` holds
+    the waveform as ``float32`` samples in ``[-1, 1]`` (or ``None``).
+
+    Every frame is scaled to fit a `frame_size` x `frame_size` square and
+    letterboxed, so that frames of all videos have the same shape.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_fps: float = 1.0,
+        frame_size: int = 640,
+        audio: bool = True,
+    ) -> None:
+        self.path = path
+        self.sample_fps = sample_fps
+        self.frame_size = frame_size
+        self.with_audio = audio
+        self.audio: np.ndarray | None = None
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        size = self.frame_size
+        cmd = [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-nostdin",
+            "-i",
+            self.path,
+            "-map",
+            "0:v:0",
+            "-vf",
+            f"fps={self.sample_fps},"
+            f"scale={size}:{size}:force_original_aspect_ratio=decrease,"
+            f"pad={size}:{size}:(ow-iw)/2:(oh-ih)/2",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "pipe:1",
+        ]
+
+        pass_fds = ()
+        audio_chunks = []
+        if self.with_audio:
+            audio_read, audio_write = os.pipe()
+            pass_fds = (audio_write,)
+            cmd += [
+                "-map",
+                "0:a:0",
+                "-ac",
+                "1",
+                "-ar",
+                str(AUDIO_SAMPLE_RATE),
+                "-f",
+                "f32le",
+                f"pipe:{audio_write}",
+            ]
+
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=pass_fds
+        )
+
+        # Drain stderr and the audio pipe on background threads so that ffmpeg
+        # never blocks on a full pipe while frames are being consumed
+        stderr_chunks = []
+        readers = [
+            threading.Thread(target=_drain, args=(process.stderr, stderr_chunks))
+        ]
+        if self.with_audio:
+            os.close(audio_write)
+            audio_file = os.fdopen(audio_read, "rb")
+            readers.append(
+                threading.Thread(target=_drain, args=(audio_file, audio_chunks))
+            )
+        for reader in readers:
+            reader.start()
+
+        frame_bytes = size * size * 3
+        try:
+            while len(buffer := process.stdout.read(frame_bytes)) == frame_bytes:
+                yield np.frombuffer(buffer, dtype=np.uint8).reshape(size, size, 3)
+        finally:
+            process.stdout.close()
+            process.wait()
+            for reader in readers:
+                reader.join()
+
+        if process.returncode != 0:
+            stderr = b"".join(stderr_chunks).decode(errors="replace").strip()
+            logger.warning(f"ffmpeg exited with code {process.returncode}: {stderr}")
+
+        if self.with_audio:
+            self.audio = np.frombuffer(b"".join(audio_chunks), dtype=np.float32)
+
+
+def _drain(stream, chunks: list[bytes]) -> None:
+    with stream:
+        while chunk := stream.read(1 << 16):
+            chunks.append(chunk)
@@ -0,0 +1,151 @@
+import time
+import asyncio
+
+import aiofiles
+import aiohttp
+from loguru import logger
+
+
+class CircuitBreaker:
+    """Stops calling a remote service while it keeps failing.
+
+    The breaker opens after `failure_threshold` consecutive failures, and
+    every call is refused for `recovery_time` seconds. After that, a single
+    trial call is let through (half-open): if it succeeds the breaker closes,
+    otherwise it opens again for another `recovery_time` seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 60.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._recovered():
+            return self.HALF_OPEN
+        return self._state
+
+    def _recovered(self) -> bool:
+        return time.monotonic() - self.opened_at >= self.recovery_time
+
+    def allow(self) -> bool:
+        """Whether a call may be made now. Claims the trial call when half-open."""
+        if self._state == self.CLOSED:
+            return True
+        if self._recovered():
+            # Refuse other calls until the trial call has finished, or has
+            # taken as long as the recovery time
+            self._state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._state != self.CLOSED:
+            logger.info("Circuit breaker closed, the remote service recovered.")
+        self._state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning(
+                    f"Circuit breaker opened after {self.failures} failures, retrying in {self.recovery_time:.0f}s."
+                )
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class FlorenceClient:
+    """An asynchronous client of a Florence-2 OCR endpoint.
+
+    The endpoint receives a `POST` with the image as the `image` field of a
+    multipart form, and answers with a JSON object whose `text` is the text
+    of the image. At most `max_concurrency` requests are in flight at once,
+    each one limited to `timeout` seconds, and a :class:`CircuitBreaker`
+    stops sending requests while the endpoint is unhealthy.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        endpoint: str,
+        max_concurrency: int = 4,
+        timeout: float = 30.0,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.session = session
+        self.endpoint = endpoint
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.successes = 0
+        self.failures = 0
+        self.refused = 0
+
+    @property
+    def available(self) -> bool:
+        """Whether requests are currently sent at all."""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    async def ocr(self, image: str | bytes) -> str | None:
+        """Read the text of an image from a file path or its bytes.
+
+        Returns
+        -------
+        Optional[:class:`str`]
+            The text, or ``None`` if the request failed or was refused by
+            the circuit breaker, in which case another engine should be used.
+        """
+        async with self.semaphore:
+            if not self.breaker.allow():
+                self.refused += 1
+                return None
+
+            if isinstance(image, str):
+                async with aiofiles.open(image, mode="rb") as f:
+                    image = await f.read()
+            form = aiohttp.FormData()
+            form.add_field("image", image, filename="image")
+
+            try:
+                async with self.session.post(
+                    self.endpoint, data=form, timeout=self.timeout
+                ) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                text = result["text"]
+                if not isinstance(text, str):
+                    raise TypeError(f"text is {type(text).__name__}, not str")
+            # A body that isn't JSON raises a ValueError (json.JSONDecodeError)
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                KeyError,
+                TypeError,
+                ValueError,
+            ) as e:
+                self.failures += 1
+                self.breaker.record_failure()
+                logger.warning(
+                    f"Florence-2 OCR failed: {type(e).__name__}: {e or 'timed out'}"
+                )
+                return None
+
+        self.successes += 1
+        self.breaker.record_success()
+        return text
+
+    def __str__(self) -> str:
+        return (
+            f"{self.breaker.state}, {self.successes} succeeded, "
+            f"{self.failures} failed, {self.refused} refused"
+        )
@@ -0,0 +1,119 @@
+from typing import Iterable
+
+import numpy as np
+
+# The number of set bits in every possible byte value
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """Count the set bits of every element of a ``uint64`` array."""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class _HashBucket:
+    """The hashes of a single guild, stored in contiguous arrays."""
+
+    __slots__ = ("ids", "hashes", "size", "positions")
+
+    def __init__(self) -> None:
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.size = 0
+        self.positions: dict[int, int] = {}
+
+    def add(self, record_id: int, hash: int) -> None:
+        position = self.positions.get(record_id)
+        if position is not None:
+            self.hashes[position] = np.int64(hash).view(np.uint64)
+            return
+
+        # Grow the arrays geometrically so that appends are amortized O(1)
+        if self.size == len(self.ids):
+            capacity = max(16, 2 * self.size)
+            self.ids = np.resize(self.ids, capacity)
+            self.hashes = np.resize(self.hashes, capacity)
+
+        self.ids[self.size] = record_id
+        self.hashes[self.size] = np.int64(hash).view(np.uint64)
+        self.positions[record_id] = self.size
+        self.size += 1
+
+    def remove(self, record_id: int) -> None:
+        position = self.positions.pop(record_id, None)
+        if position is None:
+            return
+
+        # Move the last entry into the freed slot to keep the arrays dense
+        last = self.size - 1
+        if position != last:
+            last_id = int(self.ids[last])
+            self.ids[position] = last_id
+            self.hashes[position] = self.hashes[last]
+            self.positions[last_id] = position
+        self.size -= 1
+
+    def search(self, hash: int, max_distance: int) -> list[int]:
+        distances = _popcount64(
+            self.hashes[: self.size] ^ np.int64(hash).view(np.uint64)
+        )
+        return self.ids[: self.size][distances <= max_distance].tolist()
+
+
+class HashIndex:
+    """An in-memory index of media hashes, partitioned by guild.
+
+    Answers Hamming-distance radius queries with a vectorized XOR/popcount
+    scan, so that near-duplicate lookups don't need a database round-trip.
+    Only record identifiers are returned; the records themselves are then
+    fetched from the database in a single query.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: dict[int, _HashBucket] = {}
+
+    def __len__(self) -> int:
+        return sum(bucket.size for bucket in self._buckets.values())
+
+    def load(self, records: Iterable[tuple[int, int, int]]) -> None:
+        """Replace the contents of the index.
+
+        Parameters
+        ----------
+        records: Iterable[tuple[:class:`int`, :class:`int`, :class:`int`]]
+            The `(id, guild_id, hash)` of every record.
+        """
+        self._buckets = {}
+        for record_id, guild_id, hash in records:
+            self.add(guild_id, record_id, hash)
+
+    def add(self, guild_id: int, record_id: int, hash: int | None) -> None:
+        """Add a record to the index, or update its hash if it is already indexed."""
+        if hash is None:
+            self.remove(guild_id, record_id)
+            return
+        bucket = self._buckets.get(guild_id)
+        if bucket is None:
+            bucket = self._buckets[guild_id] = _HashBucket()
+        bucket.add(record_id, hash)
+
+    def remove(self, guild_id: int, record_id: int) -> None:
+        """Remove a record from the index."""
+        bucket = self._buckets.get(guild_id)
+        if bucket is not None:
+            bucket.remove(record_id)
+
+    def search(self, guild_id: int, hash: int, max_distance: int) -> list[int]:
+        """Find the records of a guild within a Hamming distance of a hash.
+
+        Returns
+        -------
+        List[:class:`int`]
+            The identifiers of the matching records.
+        """
+        bucket = self._buckets.get(guild_id)
+        if bucket is None:
+            return []
+        return bucket.search(hash, max_distance)
@@ -1,38 +1,30 @@
-import pytesseract
+import io
+
 import imagehash
-from gradio_client import handle_file
 from PIL import Image
 
 import utils
+from .ocr import ocr_image
 
 
 class ImageProcessor:
-    def __init__(self, filename: str) -> None:
-        self.path = filename
-        self.image = Image.open(filename)
+    def __init__(self, source: str | bytes) -> None:
+        # Images can be decoded straight from an in-memory buffer
+        if isinstance(source, bytes):
+            self.path = None
+            self.image = Image.open(io.BytesIO(source))
+        else:
+            self.path = source
+            self.image = Image.open(source)
         self.hash = utils.twos_complement(str(imagehash.phash(self.image)), 64)
 
     def __del__(self) -> None:
         pass
 
-    def ocr(self, prefer_florence_2: bool = False) -> str:
-        if prefer_florence_2:
-            try:
-                result = self.florence_client.predict(
-                    image=handle_file(self.path),
-                    task_prompt="OCR",
-                    text_input=None,
-                    model_id="microsoft/Florence-2-large",
-                    api_name="/process_image",
-                )
-
-                # Strip {'<OCR>': ' from the front and '} from the back
-                text = result[0][11:-2]
-            except Exception as e:
-                logger.warning(f"Couldn't use Florence-2 for OCR. Reason: {e}")
-                text = pytesseract.image_to_string(self.image)
-        else:
-            text = pytesseract.image_to_string(self.image)
+    def ocr(self) -> str:
+        # Florence-2 is called asynchronously by the bot (see `FlorenceClient`),
+        # so the processor only ever uses Tesseract
+        text = ocr_image(self.image)
         # text = utils.text_post_processing(text)
         return text
 
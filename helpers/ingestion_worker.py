@@ -0,0 +1,161 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from database import QueuedAttachment
+from .pipeline import AttachmentJob
+from .scheduler import KINDS, background_capacity, class_caps
+
+if TYPE_CHECKING:
+    from bot import SauronBot
+
+
+class IngestionWorker:
+    """Ingests attachments from the ingestion queue, outside of the bot's process.
+
+    Jobs are claimed in batches with `FOR UPDATE SKIP LOCKED`, so any number
+    of workers, on any number of machines, can share the queue. An idle
+    worker sleeps until the bot enqueues new jobs (`LISTEN ingestion_jobs`)
+    or `poll_interval` seconds pass, whichever comes first, which is also
+    how often jobs of dead workers are recovered.
+
+    Jobs are claimed by class priority (live, then catch-up, then scrub),
+    and each class is capped to `caps` of the `concurrency` in-flight jobs,
+    like an :class:`IngestionScheduler`. Catch-up and scrub jobs together
+    never hold the last slot, which is kept for live jobs.
+
+    A job is retried up to `max_attempts` times. While a worker runs, it
+    renews its jobs every `poll_interval` seconds, and a job is considered
+    abandoned once its worker hasn't renewed it for `lock_timeout` seconds,
+    so a slow job is never claimed twice.
+    """
+
+    def __init__(
+        self,
+        bot: "SauronBot",
+        name: str,
+        concurrency: int = 4,
+        caps: dict[str, int] | None = None,
+        max_attempts: int = 3,
+        lock_timeout: float = 900.0,
+        poll_interval: float = 30.0,
+    ) -> None:
+        self.bot = bot
+        self.name = name
+        self.concurrency = concurrency
+        self.caps = class_caps(concurrency, caps or {})
+        self.max_attempts = max_attempts
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.done = 0
+        self.failed = 0
+        # The class of every in-flight job, by task
+        self._tasks: dict[asyncio.Task, str] = {}
+        self._wakeup = asyncio.Event()
+
+    async def run(self) -> None:
+        """Ingest queued attachments until cancelled."""
+        await self.bot.add_notification_listener("ingestion_jobs", self._on_enqueue)
+        logger.info(
+            f"Ingestion worker '{self.name}' started with a concurrency of {self.concurrency}."
+        )
+
+        loop = asyncio.get_running_loop()
+        maintain_at = 0.0
+        try:
+            while True:
+                if loop.time() >= maintain_at:
+                    await self._maintain()
+                    maintain_at = loop.time() + self.poll_interval
+
+                # Clear the flag before claiming, so that jobs enqueued while
+                # claiming still wake the worker up
+                self._wakeup.clear()
+                claimed = await self._claim()
+                if claimed and len(self._tasks) < self.concurrency:
+                    continue
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.bot.remove_notification_listener(
+                "ingestion_jobs", self._on_enqueue
+            )
+            for task in list(self._tasks):
+                task.cancel()
+
+    async def _claim(self) -> int:
+        """Claim as many jobs as there are free slots, by class priority."""
+        claimed = 0
+        for kind in KINDS:
+            running = sum(1 for task_kind in self._tasks.values() if task_kind == kind)
+            limit = min(self.concurrency - len(self._tasks), self.caps[kind] - running)
+            if kind != "live":
+                background = sum(
+                    1 for task_kind in self._tasks.values() if task_kind != "live"
+                )
+                limit = min(limit, background_capacity(self.concurrency) - background)
+            if limit <= 0:
+                continue
+            try:
+                jobs = await self.bot.claim_queued_attachments(self.name, kind, limit)
+            except Exception as e:
+                logger.warning(f"Failed to claim ingestion jobs: {e}")
+                break
+            for job in jobs:
+                task = asyncio.create_task(self._ingest(job))
+                self._tasks[task] = kind
+                task.add_done_callback(self._on_done)
+            claimed += len(jobs)
+        return claimed
+
+    def _on_enqueue(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._wakeup.set()
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.pop(task, None)
+        self._wakeup.set()
+        if not task.cancelled() and task.exception() is not None:
+            # The job stays claimed, and is recovered after the lock timeout
+            logger.error(f"Failed to report an ingestion job: {task.exception()}")
+
+    async def _maintain(self) -> None:
+        try:
+            if self._tasks:
+                await self.bot.renew_queued_attachments(self.name)
+            recovered = await self.bot.recover_queued_attachments(
+                self.lock_timeout, self.max_attempts
+            )
+            purged = await self.bot.purge_queued_attachments()
+        except Exception as e:
+            logger.warning(f"Failed to maintain the ingestion queue: {e}")
+            return
+        if recovered or purged:
+            logger.info(
+                f"Recovered {recovered} abandoned jobs and purged {purged} finished jobs."
+            )
+        logger.debug(
+            f"Ingestion worker '{self.name}': {len(self._tasks)} running, {self.done} done, {self.failed} failed."
+        )
+
+    async def _ingest(self, job: QueuedAttachment) -> None:
+        logger.info(
+            f"[{job.attachment_index}] Ingestion job {job.id} ({job.kind}, attempt {job.attempts})"
+        )
+        try:
+            matches = await self.bot.ingest_attachment(
+                AttachmentJob.from_record(job), job.update_existing, kind=job.kind
+            )
+        except Exception as e:
+            logger.exception(f"└ Ingestion job {job.id} failed: {e}")
+            self.failed += 1
+            await self.bot.fail_queued_attachment(
+                job.id, f"{type(e).__name__}: {e}", self.max_attempts
+            )
+            return
+
+        self.done += 1
+        await self.bot.finish_queued_attachment(job.id, matches)
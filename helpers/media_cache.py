@@ -0,0 +1,131 @@
+import os
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+
+class MediaCache:
+    """A size-budgeted LRU cache of downloaded media files.
+
+    Files are stored under collision-free keys derived from their URL, so that
+    repeated downloads of the same attachment can be reused. When the cache
+    grows beyond `max_bytes`, the least recently used files are evicted.
+    Files that are pinned by an in-flight job are never evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._pins: dict[str, int] = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Adopt files left over from a previous run, oldest first
+        files = [entry for entry in os.scandir(directory) if entry.is_file()]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            self._entries[entry.name] = entry.stat().st_size
+            self.bytes_used += entry.stat().st_size
+        self.evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(url: str) -> str:
+        """Get the cache key of a URL.
+
+        The query string is ignored, since Discord CDN URLs carry expiring
+        signature parameters that change between fetches of the same file.
+        """
+        parts = urlsplit(url)
+        digest = hashlib.sha256(f"{parts.netloc}{parts.path}".encode()).hexdigest()
+        extension = os.path.splitext(parts.path)[1].lower()
+        return f"{digest[:32]}{extension}"
+
+    def path(self, key: str) -> str:
+        """Get the path a cached file is (or will be) stored at."""
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key: str) -> str | None:
+        """Get the path of a cached file, marking it as recently used."""
+        if key not in self._entries or not os.path.exists(self.path(key)):
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self.path(key)
+
+    def add(self, key: str) -> None:
+        """Register a file that was written to `path(key)`, then enforce the budget."""
+        self.bytes_used -= self._entries.pop(key, 0)
+        size = os.path.getsize(self.path(key))
+        self._entries[key] = size
+        self.bytes_used += size
+        self.evict()
+
+    def pin(self, key: str) -> None:
+        """Prevent a file from being evicted until it is unpinned."""
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+        else:
+            self._pins.pop(key, None)
+
+    @contextmanager
+    def pinned(self, key: str):
+        self.pin(key)
+        try:
+            yield
+        finally:
+            self.unpin(key)
+
+    def evict(self, max_bytes: int | None = None) -> int:
+        """Evict the least recently used unpinned files until under budget.
+
+        Returns
+        -------
+        :class:`int`
+            The number of evicted files.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        evicted = 0
+        for key in list(self._entries):
+            if self.bytes_used <= max_bytes:
+                break
+            if key in self._pins:
+                continue
+            self._remove(key)
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def clear(self) -> int:
+        """Evict every unpinned file."""
+        return self.evict(max_bytes=0)
+
+    def _remove(self, key: str) -> None:
+        self.bytes_used -= self._entries.pop(key)
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting cached media {key}: {e}")
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self)} files, {self.bytes_used / 2**20:.1f}/{self.max_bytes / 2**20:.1f} MiB, "
+            f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+        )
@@ -0,0 +1,436 @@
+import time
+import asyncio
+from collections import Counter, OrderedDict, namedtuple
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable
+
+import disnake
+from loguru import logger
+
+import utils
+from .analysis import MediaAnalysis
+from .media_cache import MediaCache
+
+if TYPE_CHECKING:
+    from bot import SauronBot
+
+
+class AttachmentJob(
+    namedtuple(
+        "AttachmentJob",
+        [
+            "guild_id",
+            "channel_id",
+            "message_id",
+            "attachment_index",
+            "filename",
+            "url",
+            "size",
+            "content_type",
+            "timestamp",
+            "author_id",
+            "by_bot",
+            "bot_id",
+        ],
+    )
+):
+    """Everything needed to ingest a single message attachment.
+
+    Unlike :class:`disnake.Message`, a job holds only plain values, so it can
+    be queued, batched or pickled without keeping the message alive.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_message(
+        cls, message: disnake.Message, attachment_index: int
+    ) -> "AttachmentJob":
+        attachment = message.attachments[attachment_index]
+
+        # Determine if the message was posted via a bot
+        author_id = message.author.id
+        posted_by_bot = False
+        bot_id = None
+        if message.author.bot:
+            posted_by_bot = True
+            bot_id = author_id
+            if message.type == disnake.MessageType.application_command:
+                author_id = message.interaction.user.id
+
+        return cls(
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            message_id=message.id,
+            attachment_index=attachment_index,
+            filename=attachment.filename,
+            url=attachment.url,
+            size=attachment.size,
+            content_type=utils.get_content_type(attachment),
+            timestamp=message.created_at,
+            author_id=author_id,
+            by_bot=posted_by_bot,
+            bot_id=bot_id,
+        )
+
+    @classmethod
+    def from_record(cls, record) -> "AttachmentJob":
+        """Rebuild a job from a row with the same fields, e.g. from the ingestion queue."""
+        return cls(*(getattr(record, field) for field in cls._fields))
+
+    @property
+    def cache_key(self) -> str:
+        """The key of the attachment in the :class:`MediaCache`."""
+        return MediaCache.key(self.url)
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
+
+
+class PipelineStats:
+    """Per-stage counters of an :class:`IngestionPipeline` run.
+
+    `checkpoint` is the identifier of the last message (in input order) that,
+    along with every message before it, has been completely ingested, and
+    `checkpointed` is the number of messages up to and including it. It
+    never moves past a message with an attachment that failed, so that
+    resuming from it retries the attachment.
+    """
+
+    STAGES = ("messages", "downloaded", "analyzed", "written")
+    QUEUE_STAGES = ("messages", "queued")
+
+    def __init__(self, stages: tuple[str, ...] = STAGES) -> None:
+        self.started_at = time.monotonic()
+        self.counts = dict.fromkeys(stages, 0)
+        self.skipped = 0
+        self.failed = 0
+        self.checkpoint: int | None = None
+        self.checkpointed = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def __str__(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        stages = " | ".join(
+            f"{stage}: {count} ({count / elapsed:.2f}/s)"
+            for stage, count in self.counts.items()
+        )
+        return f"{stages} | skipped: {self.skipped} | failed: {self.failed}"
+
+
+class IngestionPipeline:
+    """A staged, bounded pipeline for bulk ingestion of message attachments.
+
+    Messages flow from a single history producer through download workers,
+    analysis workers and a single database writer. Every stage is connected
+    by a bounded queue, so a slow stage applies backpressure to the ones
+    before it and the number of pinned files in the media cache stays bounded.
+
+    Database access is batched: the producer filters out existing
+    attachments with one query per `batch_size` jobs, and the writer flushes
+    analysed records in one transaction per batch (or every
+    `flush_interval` seconds, whichever comes first).
+
+    Attachments are scheduled as ingestion jobs of class `kind`. If
+    `enqueue` is set, they are not ingested in this process: each batch is
+    enqueued into the ingestion queue instead, for the ingestion workers.
+    """
+
+    def __init__(
+        self,
+        bot: "SauronBot",
+        update_existing: bool = False,
+        download_workers: int = 4,
+        analysis_workers: int = 4,
+        queue_size: int = 16,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        kind: str = "scrub",
+        enqueue: bool = False,
+    ) -> None:
+        self.bot = bot
+        self.update_existing = update_existing
+        self.kind = kind
+        self.enqueue = enqueue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.download_workers = download_workers
+        self.analysis_workers = analysis_workers
+        self.download_queue = asyncio.Queue(maxsize=queue_size)
+        self.analysis_queue = asyncio.Queue(maxsize=queue_size)
+        self.write_queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = PipelineStats(
+            PipelineStats.QUEUE_STAGES if enqueue else PipelineStats.STAGES
+        )
+
+        # The number of unfinished attachments of every message in flight,
+        # in input order, used to advance the checkpoint. Messages after the
+        # first failed one can't be checkpointed, so they aren't tracked.
+        self._remaining: OrderedDict[int, int] = OrderedDict()
+        self._failed_message: int | None = None
+
+        # The media cache keys pinned by this pipeline and not unpinned yet
+        self._pinned: Counter[str] = Counter()
+
+    async def run(
+        self,
+        messages: AsyncIterator[disnake.Message],
+        on_progress: Callable[[PipelineStats], Awaitable[None]] | None = None,
+        progress_interval: float = 30.0,
+    ) -> PipelineStats:
+        """Ingest every attachment of every message.
+
+        Parameters
+        ----------
+        messages: AsyncIterator[:class:`disnake.Message`]
+            The messages to ingest, e.g. from `channel.history()`.
+        on_progress: Callable[[:class:`PipelineStats`], Awaitable[None]]
+            Called every `progress_interval` seconds while the pipeline runs.
+        """
+        reporter = None
+        if on_progress is not None:
+            reporter = asyncio.create_task(
+                self._report_progress(on_progress, progress_interval)
+            )
+
+        try:
+            if self.enqueue:
+                await self._produce(messages)
+            else:
+                await self._run_stages(messages)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+        logger.info(
+            f"Finished ingestion pipeline in {self.stats.elapsed:.0f}s. {self.stats}"
+        )
+        return self.stats
+
+    async def _run_stages(self, messages: AsyncIterator[disnake.Message]) -> None:
+        try:
+            await self._gather_stages(messages)
+        finally:
+            # A cancelled pipeline (e.g. a paused scrub) leaves downloads in
+            # its queues that will never be analysed
+            for key, count in self._pinned.items():
+                for _ in range(count):
+                    self.bot.media_cache.unpin(key)
+            self._pinned.clear()
+
+    async def _gather_stages(self, messages: AsyncIterator[disnake.Message]) -> None:
+        tasks = [
+            asyncio.create_task(stage)
+            for stage in (
+                self._produce(messages),
+                self._run_stage(
+                    self._download,
+                    self.download_queue,
+                    self.analysis_queue,
+                    concurrency=self.download_workers,
+                    consumers=self.analysis_workers,
+                ),
+                self._run_stage(
+                    self._analyze,
+                    self.analysis_queue,
+                    self.write_queue,
+                    concurrency=self.analysis_workers,
+                    consumers=1,
+                ),
+                self._write(),
+            )
+        ]
+        try:
+            # Unlike a TaskGroup, this raises the stage's own exception rather
+            # than an ExceptionGroup
+            await asyncio.gather(*tasks)
+        finally:
+            # A failed (or cancelled) stage stops its siblings, which would
+            # otherwise keep downloading and writing in the background
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _report_progress(self, on_progress, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await on_progress(self.stats)
+            except Exception as e:
+                logger.warning(f"Failed to report pipeline progress: {e}")
+
+    async def _produce(self, messages: AsyncIterator[disnake.Message]) -> None:
+        try:
+            batch = []
+            async for message in messages:
+                self.stats.counts["messages"] += 1
+                if self._failed_message is None:
+                    self._remaining[message.id] = len(message.attachments)
+                    if not message.attachments:
+                        self._advance_checkpoint()
+                for attachment_index in range(len(message.attachments)):
+                    batch.append(AttachmentJob.from_message(message, attachment_index))
+                if len(batch) >= self.batch_size:
+                    await self._enqueue_downloads(batch)
+                    batch = []
+            if batch:
+                await self._enqueue_downloads(batch)
+        finally:
+            # When the pipeline is cancelled, every stage is stopped anyway,
+            # and the queues may be full with nobody left to consume them
+            if not self.enqueue and not asyncio.current_task().cancelling():
+                for _ in range(self.download_workers):
+                    await self.download_queue.put(None)
+
+    async def _enqueue_downloads(self, jobs: list[AttachmentJob]) -> None:
+        existing = await self.bot.filter_existing_attachments(jobs)
+        queued = []
+        for job, exists in zip(jobs, existing):
+            if job.content_type is None:
+                logger.error(f"Attachment {job.filename} has an invalid content type")
+                self.stats.skipped += 1
+                self._complete(job)
+            elif exists and not self.update_existing:
+                self.stats.skipped += 1
+                self._complete(job)
+            elif self.enqueue:
+                queued.append(job)
+            else:
+                await self.download_queue.put((job, exists))
+
+        # Enqueued jobs are durable, so they count as complete for checkpoints
+        if queued:
+            await self.bot.enqueue_attachments(queued, self.kind, self.update_existing)
+            self.stats.counts["queued"] += len(queued)
+            for job in queued:
+                self._complete(job)
+
+    def _complete(self, job: AttachmentJob, failed: bool = False) -> None:
+        """Mark an attachment as finished, whether it was ingested or not."""
+        if job.message_id not in self._remaining:
+            return
+        self._remaining[job.message_id] -= 1
+        if failed:
+            # Every message from this one on has to be retried when resuming
+            self._failed_message = job.message_id
+            while next(reversed(self._remaining)) != job.message_id:
+                self._remaining.popitem()
+        self._advance_checkpoint()
+
+    def _advance_checkpoint(self) -> None:
+        while self._remaining:
+            message_id, remaining = next(iter(self._remaining.items()))
+            if remaining > 0 or message_id == self._failed_message:
+                break
+            self._remaining.popitem(last=False)
+            self.stats.checkpoint = message_id
+            self.stats.checkpointed += 1
+
+    async def _run_stage(
+        self,
+        handler,
+        in_queue: asyncio.Queue,
+        out_queue: asyncio.Queue,
+        concurrency: int,
+        consumers: int,
+    ) -> None:
+        async def worker():
+            while (item := await in_queue.get()) is not None:
+                try:
+                    result = await handler(item)
+                except Exception as e:
+                    logger.exception(f"Ingestion pipeline stage failed: {e}")
+                    self.stats.failed += 1
+                    result = None
+                if result is None:
+                    self._complete(item[0], failed=True)
+                else:
+                    await out_queue.put(result)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            # Signal every worker of the next stage that there is no more work
+            if not asyncio.current_task().cancelling():
+                for _ in range(consumers):
+                    await out_queue.put(None)
+
+    async def _download(self, item):
+        job, exists = item
+
+        # Keep the file in the media cache until it has been analysed
+        self._pin(job.cache_key)
+        media = await self.bot.download_attachment(job)
+        if media is None:
+            self._unpin(job.cache_key)
+            self.stats.failed += 1
+            return None
+
+        self.stats.counts["downloaded"] += 1
+        return job, exists, media
+
+    async def _analyze(self, item):
+        job, exists, media = item
+        try:
+            analysis = await self.bot.analyze_attachment(job, media, self.kind)
+        finally:
+            self._unpin(job.cache_key)
+
+        if analysis is None:
+            self.stats.failed += 1
+            return None
+
+        self.stats.counts["analyzed"] += 1
+        return job, exists, analysis
+
+    def _pin(self, key: str) -> None:
+        self.bot.media_cache.pin(key)
+        self._pinned[key] += 1
+
+    def _unpin(self, key: str) -> None:
+        self.bot.media_cache.unpin(key)
+        self._pinned[key] -= 1
+        if self._pinned[key] <= 0:
+            del self._pinned[key]
+
+    async def _write(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch = []
+        flush_at = 0.0
+        while True:
+            timeout = max(0.0, flush_at - loop.time()) if batch else None
+            try:
+                item = await asyncio.wait_for(self.write_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._flush(batch)
+                batch = []
+                continue
+
+            if item is None:
+                break
+            if not batch:
+                flush_at = loop.time() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[AttachmentJob, bool, MediaAnalysis]]):
+        failed = False
+        try:
+            await self.bot.store_media_records(batch, self.update_existing)
+            self.stats.counts["written"] += len(batch)
+        except Exception as e:
+            logger.exception(
+                f"Failed to write {len(batch)} records to the database: {e}"
+            )
+            self.stats.failed += len(batch)
+            failed = True
+        for job, _, _ in batch:
+            self._complete(job, failed)
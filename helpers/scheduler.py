@@ -0,0 +1,152 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Ingestion job classes, from the highest priority to the lowest
+KINDS = ("live", "catch_up", "scrub")
+
+
+def class_caps(capacity: int, caps: dict[str, int]) -> dict[str, int]:
+    """Resolve the maximum number of in-flight jobs of every class.
+
+    Live jobs are never capped. A cap of ``0`` (the default) lets a class
+    use every slot but one, so that a live job never waits for a slot that
+    only background work holds.
+    """
+    resolved = {}
+    for kind in KINDS:
+        cap = caps.get(kind, 0) if kind != "live" else capacity
+        resolved[kind] = (
+            min(capacity, cap) if cap > 0 else background_capacity(capacity)
+        )
+    return resolved
+
+
+def background_capacity(capacity: int) -> int:
+    """The number of slots that catch-up and scrub jobs may hold between them.
+
+    One slot is always left for live jobs, unless there is only one slot:
+    running jobs are never preempted, so a live job then waits for the
+    background job holding it, and only goes first among the waiting jobs.
+    """
+    return max(1, capacity - 1)
+
+
+class IngestionScheduler:
+    """Shares a fixed number of slots (e.g. worker processes) between ingestion jobs.
+
+    Waiting jobs are granted a slot by class priority (live, then catch-up,
+    then scrub), and each class is capped so that it can't hold every slot.
+    Catch-up and scrub jobs together are also limited to every slot but
+    one. Within a class, guilds take turns, so a guild with a large backlog can't
+    starve the others. Running jobs are never preempted, but a live job only
+    waits for the next slot to free up rather than for the whole backlog.
+    """
+
+    def __init__(self, capacity: int, caps: dict[str, int] | None = None) -> None:
+        self.capacity = capacity
+        self.caps = class_caps(capacity, caps or {})
+        self.in_flight = dict.fromkeys(KINDS, 0)
+        self.granted = dict.fromkeys(KINDS, 0)
+
+        # The most recent waiting times of every class, in seconds
+        self.wait_times = {kind: deque(maxlen=1000) for kind in KINDS}
+
+        # The waiting jobs of every class, grouped by guild in turn order
+        self._waiters: dict[str, OrderedDict[int, deque[asyncio.Future]]] = {
+            kind: OrderedDict() for kind in KINDS
+        }
+
+    @asynccontextmanager
+    async def slot(self, kind: str, guild_id: int):
+        """Hold a slot for a job of a class and guild, waiting for one if needed."""
+        await self.acquire(kind, guild_id)
+        try:
+            yield
+        finally:
+            self.release(kind)
+
+    async def acquire(self, kind: str, guild_id: int) -> None:
+        start = time.monotonic()
+        if not self._waiters[kind] and self._can_start(kind):
+            self._start(kind, start)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[kind].setdefault(guild_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the job was cancelled
+                self.release(kind)
+            else:
+                self._discard(kind, guild_id, future)
+            raise
+        self._record(kind, start)
+
+    def release(self, kind: str) -> None:
+        self.in_flight[kind] -= 1
+        self._dispatch()
+
+    def _can_start(self, kind: str) -> bool:
+        if kind != "live" and self._background_in_flight() >= background_capacity(
+            self.capacity
+        ):
+            return False
+        return (
+            sum(self.in_flight.values()) < self.capacity
+            and self.in_flight[kind] < self.caps[kind]
+        )
+
+    def _background_in_flight(self) -> int:
+        return sum(count for kind, count in self.in_flight.items() if kind != "live")
+
+    def _start(self, kind: str, start: float) -> None:
+        self.in_flight[kind] += 1
+        self._record(kind, start)
+
+    def _record(self, kind: str, start: float) -> None:
+        self.granted[kind] += 1
+        self.wait_times[kind].append(time.monotonic() - start)
+
+    def _dispatch(self) -> None:
+        for kind in KINDS:
+            guilds = self._waiters[kind]
+            while guilds and self._can_start(kind):
+                guild_id, futures = next(iter(guilds.items()))
+                future = futures.popleft()
+                if futures:
+                    guilds.move_to_end(guild_id)
+                else:
+                    del guilds[guild_id]
+                self.in_flight[kind] += 1
+                future.set_result(None)
+
+    def _discard(self, kind: str, guild_id: int, future: asyncio.Future) -> None:
+        futures = self._waiters[kind].get(guild_id)
+        if futures is None:
+            return
+        try:
+            futures.remove(future)
+        except ValueError:
+            pass
+        if not futures:
+            del self._waiters[kind][guild_id]
+
+    def p95_wait(self, kind: str) -> float:
+        """The 95th percentile of the recent waiting times of a class, in seconds."""
+        wait_times = sorted(self.wait_times[kind])
+        if not wait_times:
+            return 0.0
+        return wait_times[min(len(wait_times) - 1, int(0.95 * len(wait_times)))]
+
+    def __str__(self) -> str:
+        classes = " | ".join(
+            f"{kind}: {self.in_flight[kind]}/{self.caps[kind]} running, "
+            f"{sum(map(len, self._waiters[kind].values()))} waiting, "
+            f"p95 wait {self.p95_wait(kind):.2f}s"
+            for kind in KINDS
+        )
+        return f"{self.capacity} slots | {classes}"
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+# Marks a cache miss, since `None` may be a cached value
+_MISSING = object()
+
+
+class SearchCache:
+    """An LRU cache of search results with a time-to-live, partitioned by guild.
+
+    Keys are tuples whose first element is the guild the result belongs to
+    (or ``None`` for results that don't depend on a guild's records). When a
+    guild's records change, :meth:`invalidate` drops all of its results.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._guild_keys: dict[int, set[tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def similar_media_key(guild_id: int, hash: int, max_hamming_distance: int) -> tuple:
+        return (guild_id, "similar_media", hash, max_hamming_distance)
+
+    @staticmethod
+    def text_key(guild_id: int, text: str) -> tuple:
+        # Searches that only differ in case or whitespace share a result
+        return (guild_id, "text", " ".join(text.lower().split()))
+
+    @staticmethod
+    def attachment_hash_key(media_key: Hashable) -> tuple:
+        return (None, "attachment_hash", media_key)
+
+    def get(self, key: tuple, default=None):
+        """Get a cached result, marking it as recently used."""
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING or entry[0] < time.monotonic():
+            if entry is not _MISSING:
+                self._remove(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, value) -> None:
+        """Cache a result, evicting the least recently used ones if over budget."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        guild_id = key[0]
+        if guild_id is not None:
+            self._guild_keys.setdefault(guild_id, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, guild_id: int) -> None:
+        """Drop every cached result of a guild."""
+        keys = self._guild_keys.pop(guild_id, ())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._guild_keys.clear()
+
+    def _remove(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+        guild_keys = self._guild_keys.get(key[0])
+        if guild_keys is not None:
+            guild_keys.discard(key)
+            if not guild_keys:
+                del self._guild_keys[key[0]]
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"{len(self)}/{self.max_entries} entries, {self.hits} hits, "
+            f"{self.misses} misses ({hit_rate:.1%} hit rate), "
+            f"{self.invalidations} invalidations"
+        )
@@ -0,0 +1,62 @@
+import time
+from collections import namedtuple
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+# Whisper pulls in torch, which takes seconds to import, so it is only
+# imported by the transcription workers when they load a model
+if TYPE_CHECKING:
+    import whisper
+
+# The result of a transcription job. `model_load_secs` is only non-zero for
+# the job that had to load the model into the worker process.
+Transcription = namedtuple(
+    "Transcription",
+    [
+        "text",
+        "model_load_secs",
+        "inference_secs",
+    ],
+)
+
+# Whisper models that have been loaded into this process, keyed by name.
+# Transcription workers are long-lived, so each model is loaded at most once.
+_models: dict[str, "whisper.Whisper"] = {}
+_pending_load_secs: float = 0.0
+
+
+def get_model(model_name: str = "base") -> "whisper.Whisper":
+    """Get a Whisper model, loading it on first use."""
+    global _pending_load_secs
+
+    model = _models.get(model_name)
+    if model is None:
+        import whisper
+
+        start = time.perf_counter()
+        model = whisper.load_model(model_name)
+        elapsed = time.perf_counter() - start
+        _models[model_name] = model
+        _pending_load_secs += elapsed
+        logger.info(f"Loaded Whisper model '{model_name}' in {elapsed:.2f}s")
+    return model
+
+
+def preload_model(model_name: str = "base") -> None:
+    """Process pool initializer that warms the model before the first job."""
+    get_model(model_name)
+
+
+def transcribe(audio, model_name: str = "base") -> Transcription:
+    """Transcribe an audio file (or waveform) with a warm Whisper model."""
+    global _pending_load_secs
+
+    model = get_model(model_name)
+    model_load_secs, _pending_load_secs = _pending_load_secs, 0.0
+
+    start = time.perf_counter()
+    result = model.transcribe(audio)
+    inference_secs = time.perf_counter() - start
+
+    return Transcription(result["text"], model_load_secs, inference_secs)
@@ -1,18 +1,19 @@
-import os
-import re
-import shlex
-import subprocess
+import math
+import time
+from collections.abc import Iterable, Iterator
 
 import cv2
-import whisper
+import imagehash
 import Levenshtein
-import pytesseract
 import numpy as np
 from loguru import logger
-from tqdm import tqdm
+from PIL import Image
 from videohash import VideoHash, HashAlgorithm
 
 import utils
+from . import transcriber
+from .ocr import ocr_image
+from .decode import load_audio
 
 
 class VideoProcessor:
@@ -33,175 +34,36 @@ class VideoProcessor:
     def __del__(self) -> None:
         self.video.release()
 
-    def __detect_blur_fft(
-        self, image: cv2.Mat, size: int = 60, thresh: int = 10
-    ) -> bool:
-        # grab the dimensions of the image and use the dimensions to
-        # derive the center (x, y)-coordinates
-        (h, w) = image.shape
-        (cX, cY) = (int(w / 2.0), int(h / 2.0))
-
-        # compute the FFT to find the frequency transform, then shift
-        # the zero frequency component (i.e., DC component located at
-        # the top-left corner) to the center where it will be more
-        # easy to analyze
-        fft = np.fft.fft2(image)
-        fftShift = np.fft.fftshift(fft)
-
-        # zero-out the center of the FFT shift (i.e., remove low
-        # frequencies), apply the inverse shift such that the DC
-        # component once again becomes the top-left, and then apply
-        # the inverse FFT
-        fftShift[cY - size : cY + size, cX - size : cX + size] = 0
-        fftShift = np.fft.ifftshift(fftShift)
-        recon = np.fft.ifft2(fftShift)
-
-        # compute the magnitude spectrum of the reconstructed image,
-        # then compute the mean of the magnitude values
-        magnitude = 20 * np.log(np.abs(recon))
-        mean = np.mean(magnitude)
-
-        # the image will be considered "blurry" if the mean value of the
-        # magnitudes is less than the threshold value
-        return mean <= thresh
-
-    def __detect_shot_transition(
-        self, frame1: cv2.Mat, frame2: cv2.Mat, threshold: float = 0.1
-    ) -> bool:
-        def calculate_chi_squared_distance(hist1, hist2):
-            # Avoid division by zero
-            eps = 1e-10
-
-            # Calculate chi-squared distance
-            chi_squared_distance = 0.5 * np.sum(
-                ((hist1 - hist2) ** 2) / (hist1 + hist2 + eps)
-            )
-
-            return chi_squared_distance
-
-        # Convert frames to HSV color space
-        hsv1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2HSV)
-        hsv2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2HSV)
-
-        # Calculate histograms
-        hist1 = cv2.calcHist([hsv1], [0, 1], None, [180, 256], [0, 180, 0, 256])
-        hist2 = cv2.calcHist([hsv2], [0, 1], None, [180, 256], [0, 180, 0, 256])
-
-        # Normalize histograms
-        cv2.normalize(hist1, hist1, 0, 1, cv2.NORM_MINMAX)
-        cv2.normalize(hist2, hist2, 0, 1, cv2.NORM_MINMAX)
-
-        # Calculate chi-squared distance
-        distance = calculate_chi_squared_distance(hist1, hist2)
-
-        # Check if distance exceeds the threshold
-        return distance > threshold
-
     def __get_duration_secs(self) -> int:
         fps = self.video.get(cv2.CAP_PROP_FPS)
         frame_count = int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
         duration = frame_count / fps
         return duration
 
-    def ocr(self) -> str:
-        full_text = ""
+    def __read_frames(self, sample_fps: float = 1.0) -> Iterator[np.ndarray]:
+        # Only decode every `step`-th frame, grabbing the ones in between
+        fps = self.video.get(cv2.CAP_PROP_FPS) or sample_fps
+        step = max(1, round(fps / sample_fps))
         frame_count = 0
-        last_frame_text = ""
-        frames_text = []
-
-        ret, last_frame = self.video.read()
-        while True:
-            # read a frame from the video
-            ret, frame = self.video.read()
+        while self.video.grab():
+            if frame_count % step == 0:
+                ret, frame = self.video.retrieve()
+                if not ret:
+                    break
+                yield frame
             frame_count += 1
-            logger.debug(f"Frame [{frame_count}] read: {ret}")
-
-            # break the loop if the video has ended
-            if not ret:
-                break
-
-            # skip the frame if it is not a shot transition
-            is_shot_transition = self.__detect_shot_transition(last_frame, frame)
-            logger.debug(f"\tShot transition: {is_shot_transition}")
-            if not is_shot_transition:
-                continue
-
-            # convert the frame to grayscale and detect if the frame is
-            # considered blurry or not
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            is_blurry = self.__detect_blur_fft(gray, thresh=15)
-            logger.debug(f"\tBlurry: {is_blurry}")
-
-            # skip the frame if it is blurry
-            if is_blurry:
-                continue
-
-            # swap channel ordering and OCR it
-            text = pytesseract.image_to_string(frame)
-            logger.debug(f"\tRaw OCR text: {text}")
-
-            # skip the frame if the text is empty
-            if text == "":
-                continue
-
-            # process the text
-            text = utils.text_post_processing(text)
-            frames_text.append(text)
-            logger.debug(f"\tProcessed OCR text: {text}")
-
-            # skip the frame if the text is similar to the last frame
-            dist = Levenshtein.distance(text, last_frame_text)
-            logger.debug(f"\tLevenshtein distance to last frame: {dist}")
-            if dist > 5:
-                continue
-
-            # append the text to the full text
-            full_text += text + "\n"
-            logger.debug(f"\tNew full text: {full_text}")
-
-            # update the last frame text
-            last_frame_text = text
-            last_frame = frame
-
-        print(frames_text)
-        return full_text
-
-    def transcribe(self) -> str:
+
+    def ocr(self, sample_fps: float = 1.0, time_budget: float | None = None) -> str:
+        return ocr_frames(self.__read_frames(sample_fps), time_budget)
+
+    def transcribe(self, model_name: str = "base") -> str:
         if self.__get_duration_secs() > 600:  # 10 minutes maximum
             return ""
 
-        audio_path = os.path.join(
-            self.storage_path,
-            "".join(i for i in self.path.split("\\")[-1].split(".")[0:-1]) + ".wav",
-        )
-        cmd = f"ffmpeg -y -i {self.path} -ab 160k -ac 2 -ar 44100 -vn {audio_path}"
-        process = subprocess.Popen(shlex.split(cmd), stderr=subprocess.PIPE, text=True)
-
-        progress_bar = None
-        for line in process.stderr:
-            if "Duration" in line:
-                duration = re.search(r"Duration: (.*?),", line).group(1)
-                h, m, s = map(float, duration.split(":"))
-                total_seconds = h * 3600 + m * 60 + s
-                progress_bar = tqdm(
-                    total=total_seconds,
-                    ncols=80,
-                    bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}",
-                )
-
-            if progress_bar and "time=" in line:
-                time = re.search(r"time=(.*?)[.]", line).group(1)
-                h, m, s = map(float, time.split(":"))
-                elapsed_seconds = h * 3600 + m * 60 + s
-                progress_bar.n = elapsed_seconds
-                progress_bar.refresh()
-
-        if os.path.exists(audio_path):
-            model: whisper.Whisper = whisper.load_model("base")
-            result = model.transcribe(audio_path)
-        else:
-            result = {"text": ""}
-        return result["text"]
+        audio = load_audio(self.path)
+        if audio is None:
+            return ""
+        return transcriber.transcribe(audio, model_name).text
 
     def check_hash_similarity(
         self, hash1: VideoHash, hash2: VideoHash, threshold: int = 10
@@ -209,3 +71,119 @@ class VideoProcessor:
         hamming_distance = hash1 - hash2
         similar = hamming_distance <= threshold
         return similar
+
+
+class FrameHasher:
+    """Perceptual hash of a video, built incrementally from its frames.
+
+    Every frame is shrunk to a small thumbnail as it is fed in, and the hash
+    is the pHash of a collage of all thumbnails. Unlike :class:`VideoHash`,
+    this needs no extra pass over the file and no frames on disk, so it can
+    share a single decode with OCR and transcription.
+    """
+
+    def __init__(self, thumbnail_size: int = 64) -> None:
+        self.thumbnail_size = thumbnail_size
+        self.thumbnails: list[np.ndarray] = []
+
+    def update(self, frame: np.ndarray) -> None:
+        size = self.thumbnail_size
+        self.thumbnails.append(
+            cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+        )
+
+    @property
+    def hash(self) -> int:
+        if not self.thumbnails:
+            raise ValueError("Cannot hash a video without frames")
+
+        size = self.thumbnail_size
+        cols = math.ceil(math.sqrt(len(self.thumbnails)))
+        rows = math.ceil(len(self.thumbnails) / cols)
+        collage = np.zeros((rows * size, cols * size, 3), dtype=np.uint8)
+        for i, thumbnail in enumerate(self.thumbnails):
+            row, col = divmod(i, cols)
+            collage[row * size : (row + 1) * size, col * size : (col + 1) * size] = (
+                thumbnail
+            )
+
+        image = Image.fromarray(cv2.cvtColor(collage, cv2.COLOR_BGR2RGB))
+        return utils.twos_complement(str(imagehash.phash(image)), 64)
+
+
+def detect_blur(gray: np.ndarray, thresh: float = 100.0) -> bool:
+    """Detect whether a grayscale image is blurry.
+
+    Uses the variance of the Laplacian, which is a single convolution rather
+    than a pair of full-resolution FFTs.
+    """
+    return cv2.Laplacian(gray, cv2.CV_64F).var() < thresh
+
+
+def frame_histogram(frame: np.ndarray, size: int = 64) -> np.ndarray:
+    """Compute the normalized hue/saturation histogram of a downscaled frame."""
+    small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [30, 32], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist, 1, 0, cv2.NORM_L1)
+
+
+def detect_shot_transition(
+    hist1: np.ndarray, hist2: np.ndarray, threshold: float = 0.2
+) -> bool:
+    """Detect a shot transition from the histograms of two frames."""
+    distance = cv2.compareHist(hist1, hist2, cv2.HISTCMP_BHATTACHARYYA)
+    return distance > threshold
+
+
+def ocr_frames(
+    frames: Iterable[np.ndarray],
+    time_budget: float | None = None,
+    similarity: float = 0.9,
+) -> str:
+    """OCR the text of a sequence of BGR video frames.
+
+    Only the first sharp frame of every shot is OCR'd, and text that is
+    nearly identical to the text of an earlier frame is dropped. OCR stops
+    once `time_budget` seconds have elapsed, returning the text found so far;
+    the remaining frames are left unconsumed.
+    """
+    start = time.perf_counter()
+    texts = []
+    last_hist = None
+    for frame_count, frame in enumerate(frames):
+        elapsed = time.perf_counter() - start
+        if time_budget is not None and elapsed > time_budget:
+            logger.debug(
+                f"Stopping video OCR after {elapsed:.2f}s at frame {frame_count}"
+            )
+            break
+
+        # skip the frame if it is in the same shot as the last OCR'd frame
+        hist = frame_histogram(frame)
+        if last_hist is not None and not detect_shot_transition(last_hist, hist):
+            continue
+
+        # skip the frame if it is blurry, so a sharper frame of the same
+        # shot gets a chance
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if detect_blur(gray):
+            logger.debug(f"Frame [{frame_count}] is blurry")
+            continue
+        last_hist = hist
+
+        # swap channel ordering and OCR it
+        text = ocr_image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).strip()
+        logger.debug(f"Frame [{frame_count}] OCR text: {text}")
+        if not text:
+            continue
+
+        # skip the text if it is similar to the text of an earlier frame
+        if any(Levenshtein.ratio(text, seen) >= similarity for seen in texts):
+            continue
+        texts.append(text)
+
+    # Correct the text of every kept frame in one go
+    texts = utils.text_post_processing_batch(texts)
+    logger.debug(f"Video OCR took {time.perf_counter() - start:.2f}s")
+    return "\n".join(text for text in texts if text)
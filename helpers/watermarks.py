@@ -0,0 +1,60 @@
+import bisect
+
+
+class WatermarkTracker:
+    """Tracks the messages of each channel being ingested live.
+
+    Messages are ingested concurrently and finish in any order, so the
+    watermark of a channel may only move to a finished message once every
+    older message that was started has finished too. A failed message is
+    never passed: the channel should stop advancing its watermark until a
+    catch-up has ingested it again.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[int, set[int]] = {}
+        # Finished messages waiting for an older pending message, in order
+        self._finished: dict[int, list[int]] = {}
+
+    def start(self, channel_id: int, message_id: int) -> None:
+        """Record that a message of a channel is being ingested."""
+        self._pending.setdefault(channel_id, set()).add(message_id)
+
+    def finish(self, channel_id: int, message_id: int) -> int | None:
+        """Record that a message was ingested.
+
+        Returns
+        -------
+        Optional[:class:`int`]
+            The newest message the watermark can now be advanced to, or
+            ``None`` if an older message is still being ingested.
+        """
+        pending = self._pending.get(channel_id, set())
+        pending.discard(message_id)
+        finished = self._finished.setdefault(channel_id, [])
+        bisect.insort(finished, message_id)
+
+        # Every finished message older than the oldest pending one is safe
+        ready = len(finished)
+        if pending:
+            ready = bisect.bisect_left(finished, min(pending))
+        watermark = finished[ready - 1] if ready else None
+        del finished[:ready]
+        self._discard_empty(channel_id)
+        return watermark
+
+    def fail(self, channel_id: int, message_id: int) -> None:
+        """Record that a message couldn't be ingested.
+
+        The finished messages waiting on older ones are forgotten, since the
+        watermark of the channel can't pass the failed message anyway.
+        """
+        self._pending.get(channel_id, set()).discard(message_id)
+        self._finished.pop(channel_id, None)
+        self._discard_empty(channel_id)
+
+    def _discard_empty(self, channel_id: int) -> None:
+        if not self._pending.get(channel_id):
+            self._pending.pop(channel_id, None)
+        if not self._finished.get(channel_id):
+            self._finished.pop(channel_id, None)
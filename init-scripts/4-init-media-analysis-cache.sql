@@ -0,0 +1,21 @@
+-- Create media_analysis_cache table
+-- Caches the analysis results of attachments by the SHA-256 digest of their bytes,
+-- so that exact byte-for-byte reposts skip hashing, OCR and transcription.
+CREATE TABLE IF NOT EXISTS media_analysis_cache (
+    digest BYTEA PRIMARY KEY,               -- SHA-256 digest of the attachment's bytes
+    mode TEXT,                              -- Analysis settings the entry was produced with
+    hash BIGINT,                            -- Hash value used for image similarity comparison
+    text_ocr TEXT,                          -- Extracted text from OCR (Optical Character Recognition)
+    video_transcription TEXT,               -- Transcription of the video
+    content_type TEXT,                      -- Type of media content (e.g., image, video)
+    size BIGINT,                            -- Size of the attachment in bytes
+    hit_count INTEGER DEFAULT 0,            -- Number of times the cached analysis was reused
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,  -- Timestamp of when the entry was created
+    last_used_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP -- Timestamp of when the entry was last created or reused
+);
+
+-- Entries cached before the mode was recorded are misses, and are replaced when reanalysed
+ALTER TABLE media_analysis_cache ADD COLUMN IF NOT EXISTS mode TEXT;
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS index_media_analysis_cache_last_used_at ON media_analysis_cache (last_used_at);
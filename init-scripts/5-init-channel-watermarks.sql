@@ -0,0 +1,18 @@
+-- Create channel_watermarks table
+-- Tracks the newest message of each monitored channel that has been ingested, so that
+-- catching up after a restart resumes every channel exactly where it left off.
+CREATE TABLE IF NOT EXISTS channel_watermarks (
+    channel_id BIGINT PRIMARY KEY,          -- Identifier for the monitored channel
+    guild_id BIGINT,                        -- Identifier for the guild (server) of the channel
+    last_message_id BIGINT NOT NULL,        -- Identifier of the newest message ingested without gaps
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP  -- Timestamp of when the watermark was last advanced
+);
+
+-- Seed the watermarks of channels that already have records, only when upgrading
+-- from a version without watermarks (this script also runs at every startup)
+INSERT INTO channel_watermarks (channel_id, guild_id, last_message_id)
+SELECT channel_id, MAX(guild_id), MAX(message_id)
+FROM media_fingerprints
+WHERE NOT EXISTS (SELECT 1 FROM channel_watermarks)
+GROUP BY channel_id
+ON CONFLICT (channel_id) DO NOTHING;
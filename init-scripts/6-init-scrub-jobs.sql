@@ -0,0 +1,22 @@
+-- Create scrub_jobs table
+-- Persists the progress of full scrubs, so that they can be paused and resumed (including
+-- after a restart) from the last message whose attachments were all ingested.
+CREATE TABLE IF NOT EXISTS scrub_jobs (
+    id SERIAL PRIMARY KEY,                  -- Unique identifier for each scrub
+    guild_id BIGINT,                        -- Identifier for the guild (server) of the scrubbed channel
+    channel_id BIGINT,                      -- Identifier for the scrubbed channel
+    status TEXT NOT NULL DEFAULT 'running', -- One of 'running', 'paused', 'finished' or 'failed'
+    oldest_first BOOLEAN,                   -- Whether the channel history is read oldest first
+    update_existing BOOLEAN,                -- Whether existing records are reprocessed
+    message_limit INTEGER,                  -- The maximum number of messages to scrub, if any
+    cursor_message_id BIGINT,               -- Identifier of the last message ingested without gaps
+    messages_scanned INTEGER DEFAULT 0,     -- Number of messages up to the cursor
+    written INTEGER DEFAULT 0,              -- Number of attachments written to the database (or to the ingestion queue)
+    skipped INTEGER DEFAULT 0,              -- Number of attachments skipped
+    failed INTEGER DEFAULT 0,               -- Number of attachments that couldn't be ingested
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,  -- Timestamp of when the scrub was started
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP   -- Timestamp of the last checkpoint
+);
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS index_scrub_jobs_guild_id ON scrub_jobs (guild_id);
@@ -0,0 +1,101 @@
+-- Create ingestion_jobs table
+-- A durable queue of attachments waiting to be ingested. The bot enqueues them and any number
+-- of ingestion workers (worker.py), on any machine, claim them with FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id BIGSERIAL PRIMARY KEY,               -- Unique identifier for each job
+    kind TEXT NOT NULL,                     -- Where the job came from, one of 'live', 'catch_up' or 'scrub'
+    status TEXT NOT NULL DEFAULT 'queued',  -- One of 'queued', 'running', 'done' or 'failed'
+    guild_id BIGINT,                        -- Identifier for the guild (server) of the message
+    channel_id BIGINT,                      -- Identifier for the channel of the message
+    message_id BIGINT,                      -- Identifier for the message of the attachment
+    attachment_index INTEGER,               -- Index of the attachment in the message
+    filename TEXT,                          -- Name of the file
+    url TEXT,                               -- URL of the media
+    size INTEGER,                           -- Size of the file in bytes
+    content_type TEXT,                      -- Type of media content (e.g., image, video)
+    timestamp TIMESTAMPTZ,                  -- Timestamp of when the message was sent
+    author_id BIGINT,                       -- Identifier for the author of the message
+    by_bot BOOLEAN,                         -- Whether the media was posted by a bot (TRUE) or not (FALSE)
+    bot_id BIGINT,                          -- Identifier for the bot responsible for posting the media, if applicable
+    update_existing BOOLEAN DEFAULT FALSE,  -- Whether an existing record of the attachment is reprocessed
+    attempts INTEGER DEFAULT 0,             -- Number of times a worker claimed the job
+    worker TEXT,                            -- Name of the worker that last claimed the job
+    matches INTEGER[],                      -- Identifiers of the records the attachment is a repost of
+    error TEXT,                             -- The last error raised while ingesting the attachment
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,  -- Timestamp of when the job was enqueued
+    started_at TIMESTAMPTZ,                 -- Timestamp of when the job was last claimed
+    heartbeat_at TIMESTAMPTZ,               -- Timestamp of when the worker of the running job last reported it was alive
+    finished_at TIMESTAMPTZ                 -- Timestamp of when the job was done or failed
+);
+
+-- Add the columns of tables created by older versions
+ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS index_ingestion_jobs_queued ON ingestion_jobs (kind, guild_id, id) WHERE status = 'queued';
+DROP INDEX IF EXISTS index_ingestion_jobs_running;
+CREATE INDEX IF NOT EXISTS index_ingestion_jobs_heartbeat ON ingestion_jobs (heartbeat_at) WHERE status = 'running';
+
+-- Create function to wake up idle workers when jobs are enqueued
+CREATE OR REPLACE FUNCTION notify_ingestion_jobs()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('ingestion_jobs', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create trigger for enqueued jobs (once per statement, however many rows it inserts)
+CREATE OR REPLACE TRIGGER trigger_notify_ingestion_jobs
+AFTER INSERT
+ON ingestion_jobs
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_ingestion_jobs();
+
+-- Create function to report the matches of live messages back to the bot
+CREATE OR REPLACE FUNCTION notify_ingestion_results()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('ingestion_results', json_build_object(
+        'id', NEW.id,
+        'guild_id', NEW.guild_id,
+        'channel_id', NEW.channel_id,
+        'message_id', NEW.message_id,
+        'matches', COALESCE(NEW.matches, '{}')
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create trigger for finished live jobs
+CREATE OR REPLACE TRIGGER trigger_notify_ingestion_results
+AFTER UPDATE OF status
+ON ingestion_jobs
+FOR EACH ROW
+WHEN (NEW.status = 'done' AND NEW.kind = 'live')
+EXECUTE FUNCTION notify_ingestion_results();
+
+-- Create function to keep the in-memory hash index of every process up to date, since
+-- records are now written by more than one process
+CREATE OR REPLACE FUNCTION notify_media_fingerprints()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('media_fingerprints', json_build_object(
+            'op', TG_OP, 'id', OLD.id, 'guild_id', OLD.guild_id, 'hash', NULL
+        )::text);
+    ELSE
+        PERFORM pg_notify('media_fingerprints', json_build_object(
+            'op', TG_OP, 'id', NEW.id, 'guild_id', NEW.guild_id, 'hash', NEW.hash
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create trigger for changed records
+CREATE OR REPLACE TRIGGER trigger_notify_media_fingerprints
+AFTER INSERT OR UPDATE OF hash OR DELETE
+ON media_fingerprints
+FOR EACH ROW
+EXECUTE FUNCTION notify_media_fingerprints();
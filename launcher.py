@@ -1,6 +1,10 @@
 import os
+import time
 import asyncio
 
+# Taken before the heavy imports below, for the startup timing report
+STARTED_AT = time.perf_counter()
+
 import disnake
 from loguru import logger
 from dotenv import load_dotenv
@@ -8,12 +12,11 @@ from dotenv import load_dotenv
 from bot import SauronBot, Config
 
 
-async def main():
+def load_config() -> Config:
     # Load the environment variables
     load_dotenv()
 
-    # Create config
-    config = Config(
+    return Config(
         DEBUG=os.environ["DEBUG"] in ("1", "True", "true"),
         DISNAKE_LOGGING=os.environ["DISNAKE_LOGGING"] in ("1", "True", "true"),
         TEST_MODE=os.environ["TEST_MODE"] in ("1", "True", "true"),
@@ -22,9 +25,81 @@ async def main():
         MONITORED_CHANNELS=list(map(int, os.environ["MONITORED_CHANNELS"].split(","))),
         DATABASE_URI=os.environ["DATABASE_URI"],
         TESSERACT_CMD=os.environ["TESSERACT_CMD"],
+        OCR_BACKEND=os.environ.get("OCR_BACKEND", "tesserocr"),
+        TEXT_DETECTION_MIN_REGIONS=int(
+            os.environ.get("TEXT_DETECTION_MIN_REGIONS", "1")
+        ),
+        TEXT_DETECTION_MAX_HEIGHT=float(
+            os.environ.get("TEXT_DETECTION_MAX_HEIGHT", "0.9")
+        ),
         PREFER_FLORENCE_2=os.environ["PREFER_FLORENCE_2"] in ("1", "True", "true"),
+        FLORENCE_2_ENDPOINT=os.environ.get("FLORENCE_2_ENDPOINT", ""),
+        FLORENCE_2_MAX_CONCURRENCY=int(
+            os.environ.get("FLORENCE_2_MAX_CONCURRENCY", "4")
+        ),
+        FLORENCE_2_TIMEOUT=float(os.environ.get("FLORENCE_2_TIMEOUT", "30")),
+        FLORENCE_2_FAILURE_THRESHOLD=int(
+            os.environ.get("FLORENCE_2_FAILURE_THRESHOLD", "5")
+        ),
+        FLORENCE_2_RECOVERY_TIME=float(
+            os.environ.get("FLORENCE_2_RECOVERY_TIME", "60")
+        ),
+        FLORENCE_2_RACE=os.environ.get("FLORENCE_2_RACE", "False")
+        in ("1", "True", "true"),
+        ANALYSIS_WORKERS=int(os.environ.get("ANALYSIS_WORKERS", "0")),
+        ANALYSIS_TIMEOUT=float(os.environ.get("ANALYSIS_TIMEOUT", "600")) or None,
+        WHISPER_MODEL=os.environ.get("WHISPER_MODEL", "base"),
+        WHISPER_MAX_CONCURRENCY=int(os.environ.get("WHISPER_MAX_CONCURRENCY", "1")),
+        WHISPER_PRELOAD=os.environ.get("WHISPER_PRELOAD", "True")
+        in ("1", "True", "true"),
+        ANALYSIS_CACHE_MAX_AGE_DAYS=int(
+            os.environ.get("ANALYSIS_CACHE_MAX_AGE_DAYS", "90")
+        ),
+        ANALYSIS_CACHE_MAX_ENTRIES=int(
+            os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "100000")
+        ),
+        SCRUB_DOWNLOAD_WORKERS=int(os.environ.get("SCRUB_DOWNLOAD_WORKERS", "4")),
+        SCRUB_ANALYSIS_WORKERS=int(os.environ.get("SCRUB_ANALYSIS_WORKERS", "4")),
+        SCRUB_QUEUE_SIZE=int(os.environ.get("SCRUB_QUEUE_SIZE", "16")),
+        SCRUB_BATCH_SIZE=int(os.environ.get("SCRUB_BATCH_SIZE", "100")),
+        SCRUB_FLUSH_INTERVAL=float(os.environ.get("SCRUB_FLUSH_INTERVAL", "5")),
+        CATCH_UP_WORKERS=int(os.environ.get("CATCH_UP_WORKERS", "4")),
+        IN_MEMORY_MAX_BYTES=int(os.environ.get("IN_MEMORY_MAX_BYTES", "26214400")),
+        MEDIA_CACHE_MAX_BYTES=int(
+            os.environ.get("MEDIA_CACHE_MAX_BYTES", "1073741824")
+        ),
+        SEARCH_RESULT_LIMIT=int(os.environ.get("SEARCH_RESULT_LIMIT", "100")),
+        SEARCH_CACHE_MAX_ENTRIES=int(
+            os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "1000")
+        ),
+        SEARCH_CACHE_TTL=float(os.environ.get("SEARCH_CACHE_TTL", "600")),
+        VIDEO_SINGLE_PASS=os.environ.get("VIDEO_SINGLE_PASS", "False")
+        in ("1", "True", "true"),
+        VIDEO_SAMPLE_FPS=float(os.environ.get("VIDEO_SAMPLE_FPS", "1")),
+        VIDEO_FRAME_SIZE=int(os.environ.get("VIDEO_FRAME_SIZE", "640")),
+        VIDEO_OCR=os.environ.get("VIDEO_OCR", "True") in ("1", "True", "true"),
+        VIDEO_OCR_TIME_BUDGET=float(os.environ.get("VIDEO_OCR_TIME_BUDGET", "30")),
+        INGESTION_QUEUE=os.environ.get("INGESTION_QUEUE", "False")
+        in ("1", "True", "true"),
+        INGESTION_WORKER_CONCURRENCY=int(
+            os.environ.get("INGESTION_WORKER_CONCURRENCY", "4")
+        ),
+        INGESTION_MAX_ATTEMPTS=int(os.environ.get("INGESTION_MAX_ATTEMPTS", "3")),
+        INGESTION_LOCK_TIMEOUT=float(os.environ.get("INGESTION_LOCK_TIMEOUT", "900")),
+        CATCH_UP_MAX_IN_FLIGHT=int(os.environ.get("CATCH_UP_MAX_IN_FLIGHT", "0")),
+        SCRUB_MAX_IN_FLIGHT=int(os.environ.get("SCRUB_MAX_IN_FLIGHT", "0")),
+        MESSAGE_ATTACHMENT_CONCURRENCY=int(
+            os.environ.get("MESSAGE_ATTACHMENT_CONCURRENCY", "4")
+        ),
     )
 
+
+async def main():
+    imports_secs = time.perf_counter() - STARTED_AT
+
+    # Create config
+    config = load_config()
+
     # Create logging file
     logger.add(
         "logs/sauron-bot.log",
@@ -45,8 +120,12 @@ async def main():
         intents=intents,
         reload=config.DEBUG,
     )
+    bot.startup_timings["imports"] = imports_secs
     await bot.setup_hook()
     await bot.start(config.DISCORD_BOT_TOKEN)
 
 
-asyncio.run(main())
+# The guard is required because the analysis process pool spawns workers that
+# re-import this module.
+if __name__ == "__main__":
+    asyncio.run(main())
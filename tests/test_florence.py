@@ -0,0 +1,72 @@
+import pytest
+
+from helpers import florence
+from helpers.florence import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable `time.monotonic` for the breaker."""
+    now = [1000.0]
+    monkeypatch.setattr(florence.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_time=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_lets_a_single_trial_call_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=60)
+    breaker.record_failure()
+    clock[0] += 59
+    assert not breaker.allow()
+
+    clock[0] += 1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_call_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_time=60)
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 60
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 59
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+def test_stuck_trial_call_lets_another_through_after_the_recovery_time(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=60)
+    breaker.record_failure()
+    clock[0] += 60
+    assert breaker.allow()
+    clock[0] += 60
+    assert breaker.allow()
@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from helpers.analysis import MediaAnalysis
+from helpers.media_cache import MediaCache
+from helpers.pipeline import IngestionPipeline
+
+
+class FakeBot:
+    """Stands in for the bot, failing the download of the given messages."""
+
+    def __init__(self, tmp_path, failed_downloads=(), failed_writes=False):
+        self.media_cache = MediaCache(str(tmp_path), 1 << 20)
+        self.failed_downloads = set(failed_downloads)
+        self.failed_writes = failed_writes
+        self.written = []
+
+    async def filter_existing_attachments(self, jobs):
+        return [False] * len(jobs)
+
+    async def download_attachment(self, job):
+        if job.message_id in self.failed_downloads:
+            return None
+        return b"media"
+
+    async def analyze_attachment(self, job, media, kind):
+        return MediaAnalysis(0, "", None)
+
+    async def store_media_records(self, batch, update_existing):
+        if self.failed_writes:
+            raise RuntimeError("database is down")
+        self.written.extend(job.message_id for job, _, _ in batch)
+
+
+def make_message(message_id: int, attachments: int = 1):
+    return SimpleNamespace(
+        id=message_id,
+        attachments=[
+            SimpleNamespace(
+                filename=f"{message_id}-{i}.png",
+                url=f"https://cdn.example.com/{message_id}/{i}.png",
+                size=1,
+                content_type="image/png",
+            )
+            for i in range(attachments)
+        ],
+        author=SimpleNamespace(id=1, bot=False),
+        guild=SimpleNamespace(id=1),
+        channel=SimpleNamespace(id=1),
+        created_at=None,
+    )
+
+
+async def history(messages):
+    for message in messages:
+        yield message
+
+
+def run_pipeline(bot, messages):
+    pipeline = IngestionPipeline(bot, download_workers=2, analysis_workers=2)
+    return asyncio.run(pipeline.run(history(messages))), pipeline
+
+
+def test_checkpoint_covers_every_ingested_message(tmp_path):
+    bot = FakeBot(tmp_path)
+    messages = [make_message(1), make_message(2, attachments=0), make_message(3, 3)]
+    stats, _ = run_pipeline(bot, messages)
+
+    assert stats.checkpoint == 3
+    assert stats.checkpointed == 3
+    assert stats.counts["written"] == 4
+    assert sorted(bot.written) == [1, 3, 3, 3]
+
+
+def test_checkpoint_stops_before_a_failed_message(tmp_path):
+    bot = FakeBot(tmp_path, failed_downloads={3})
+    messages = [make_message(message_id) for message_id in range(1, 6)]
+    stats, pipeline = run_pipeline(bot, messages)
+
+    # The messages after the failed one are ingested, but resuming from
+    # the checkpoint retries all of them
+    assert stats.checkpoint == 2
+    assert stats.checkpointed == 2
+    assert stats.failed == 1
+    assert sorted(bot.written) == [1, 2, 4, 5]
+    assert not pipeline._pinned
+    assert not bot.media_cache._pins
+
+
+def test_checkpoint_stays_put_when_nothing_is_written(tmp_path):
+    bot = FakeBot(tmp_path, failed_writes=True)
+    messages = [make_message(1), make_message(2)]
+    stats, _ = run_pipeline(bot, messages)
+
+    assert stats.checkpoint is None
+    assert stats.checkpointed == 0
+    assert stats.failed == 2
+
+
+def test_failed_stage_stops_the_others(tmp_path):
+    bot = FakeBot(tmp_path)
+
+    async def broken_history():
+        yield make_message(1)
+        raise RuntimeError("history is unavailable")
+
+    async def run():
+        pipeline = IngestionPipeline(bot, download_workers=2, analysis_workers=2)
+        with pytest.raises(RuntimeError, match="history is unavailable"):
+            await pipeline.run(broken_history())
+        # Only the test's own task is left running
+        assert len(asyncio.all_tasks()) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import asyncio
+
+from helpers.scheduler import IngestionScheduler, background_capacity, class_caps
+
+
+def test_class_caps_leave_a_slot_for_live_jobs():
+    assert class_caps(4, {}) == {"live": 4, "catch_up": 3, "scrub": 3}
+    assert class_caps(4, {"scrub": 2, "catch_up": 8}) == {
+        "live": 4,
+        "catch_up": 4,
+        "scrub": 2,
+    }
+    assert class_caps(1, {}) == {"live": 1, "catch_up": 1, "scrub": 1}
+
+
+def test_background_capacity():
+    assert background_capacity(1) == 1
+    assert background_capacity(2) == 1
+    assert background_capacity(8) == 7
+
+
+def test_live_job_starts_while_background_jobs_wait():
+    async def run():
+        scheduler = IngestionScheduler(4)
+        for _ in range(3):
+            await scheduler.acquire("scrub", 1)
+
+        # Background jobs together hold every slot but one
+        catch_up = asyncio.create_task(scheduler.acquire("catch_up", 1))
+        await asyncio.sleep(0)
+        assert not catch_up.done()
+
+        await asyncio.wait_for(scheduler.acquire("live", 1), timeout=1)
+        assert scheduler.in_flight == {"live": 1, "catch_up": 0, "scrub": 3}
+
+        scheduler.release("scrub")
+        await asyncio.wait_for(catch_up, timeout=1)
+        assert scheduler.in_flight == {"live": 1, "catch_up": 1, "scrub": 2}
+
+    asyncio.run(run())
+
+
+def test_class_cap_holds_back_a_class():
+    async def run():
+        scheduler = IngestionScheduler(4, {"scrub": 1})
+        await scheduler.acquire("scrub", 1)
+        scrub = asyncio.create_task(scheduler.acquire("scrub", 1))
+        await asyncio.sleep(0)
+        assert not scrub.done()
+
+        await asyncio.wait_for(scheduler.acquire("catch_up", 1), timeout=1)
+        scheduler.release("scrub")
+        await asyncio.wait_for(scrub, timeout=1)
+
+    asyncio.run(run())
+
+
+def test_waiting_jobs_are_granted_by_priority_then_guild():
+    async def run():
+        scheduler = IngestionScheduler(1)
+        await scheduler.acquire("scrub", 1)
+
+        granted = []
+
+        async def job(kind: str, guild_id: int):
+            await scheduler.acquire(kind, guild_id)
+            granted.append((kind, guild_id))
+            scheduler.release(kind)
+
+        tasks = [
+            asyncio.create_task(job(kind, guild_id))
+            for kind, guild_id in [
+                ("scrub", 1),
+                ("scrub", 1),
+                ("scrub", 2),
+                ("catch_up", 1),
+                ("live", 1),
+            ]
+        ]
+        await asyncio.sleep(0)
+        scheduler.release("scrub")
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+
+        assert granted == [
+            ("live", 1),
+            ("catch_up", 1),
+            ("scrub", 1),
+            ("scrub", 2),
+            ("scrub", 1),
+        ]
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        scheduler = IngestionScheduler(1)
+        await scheduler.acquire("live", 1)
+        waiter = asyncio.create_task(scheduler.acquire("scrub", 1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        scheduler.release("live")
+        assert scheduler.in_flight == {"live": 0, "catch_up": 0, "scrub": 0}
+        await asyncio.wait_for(scheduler.acquire("scrub", 1), timeout=1)
+
+    asyncio.run(run())
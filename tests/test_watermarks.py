@@ -0,0 +1,41 @@
+from helpers.watermarks import WatermarkTracker
+
+
+def test_watermark_waits_for_older_messages():
+    tracker = WatermarkTracker()
+    for message_id in (1, 2, 3):
+        tracker.start(10, message_id)
+
+    assert tracker.finish(10, 3) is None
+    assert tracker.finish(10, 1) == 1
+    assert tracker.finish(10, 2) == 3
+
+
+def test_channels_are_tracked_separately():
+    tracker = WatermarkTracker()
+    tracker.start(10, 1)
+    tracker.start(20, 2)
+    assert tracker.finish(20, 2) == 2
+    assert tracker.finish(10, 1) == 1
+
+
+def test_newer_messages_can_advance_while_older_ones_are_pending():
+    tracker = WatermarkTracker()
+    for message_id in (1, 2, 3, 4):
+        tracker.start(10, message_id)
+
+    assert tracker.finish(10, 2) is None
+    assert tracker.finish(10, 1) == 2
+    assert tracker.finish(10, 4) is None
+    assert tracker.finish(10, 3) == 4
+
+
+def test_failed_message_forgets_the_waiting_ones():
+    tracker = WatermarkTracker()
+    for message_id in (1, 2, 3):
+        tracker.start(10, message_id)
+
+    assert tracker.finish(10, 3) is None
+    tracker.fail(10, 2)
+    # Message 3 finished before the failure, and can't be reported as safe
+    assert tracker.finish(10, 1) == 1
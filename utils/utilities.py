@@ -1,12 +1,13 @@
-import os
-from typing import List
+import hashlib
+from typing import TYPE_CHECKING, List
 
 import disnake
-import autocorrect
-import pytesseract
 from loguru import logger
 
-pytesseract.pytesseract.tesseract_cmd = os.environ["TESSERACT_CMD"]
+# autocorrect loads its word frequency dictionary, which only the analysis
+# workers need, so it is imported by the speller itself
+if TYPE_CHECKING:
+    import autocorrect
 
 ##*************************************************##
 ##********          DISCORD UTILS           *******##
@@ -58,21 +59,63 @@ def twos_complement(hexstr: str, bits: int):
     return value
 
 
+def content_digest(media: str | bytes) -> bytes:
+    """Get the SHA-256 digest of a file's contents, or of in-memory bytes."""
+    if isinstance(media, bytes):
+        return hashlib.sha256(media).digest()
+    with open(media, "rb") as f:
+        return hashlib.file_digest(f, "sha256").digest()
+
+
+# Loading the word frequency dictionary is expensive, so a single speller is
+# built on first use and shared by every caller in the process
+_speller = None
+
+
+def get_speller() -> "autocorrect.Speller":
+    global _speller
+
+    if _speller is None:
+        import autocorrect
+
+        # Correct spelling https://github.com/filyp/autocorrect#ocr
+        _speller = autocorrect.Speller(only_replacements=True)
+    return _speller
+
+
 def text_post_processing(text: str) -> str:
     # Remove non-ASCII characters
     logger.debug(f"Original text: {text}")
     text = "".join([c if ord(c) < 128 else "" for c in text]).strip()
     logger.debug(f"ASCII text: {text}")
 
-    # Correct spelling https://github.com/filyp/autocorrect#ocr
-    spell = autocorrect.Speller(only_replacements=True)
-    logger.debug(f"Pre-corrected text: {spell(text)}")
-    text = spell(text)
+    text = get_speller()(text)
     logger.debug(f"Corrected text: {text}")
 
     return text
 
 
+def text_post_processing_batch(texts: List[str]) -> List[str]:
+    """Post-process many OCR strings at once.
+
+    Identical strings (common across video frames) are only corrected once.
+
+    Parameters
+    ----------
+    texts: List[:class:`str`]
+        The raw OCR strings.
+
+    Returns
+    -------
+    List[:class:`str`]
+        The processed strings, in the same order.
+    """
+    processed = {text: None for text in texts}
+    for text in processed:
+        processed[text] = text_post_processing(text)
+    return [processed[text] for text in texts]
+
+
 def get_content_type(attachment: disnake.Attachment) -> str:
     if attachment.content_type is None:
         if attachment.filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
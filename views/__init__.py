@@ -1 +1,2 @@
-from .paginator import Paginator
+from .paginator import ListPageSource, PageSource, Paginator
+from .search_results import SearchResultsSource
@@ -3,23 +3,42 @@ from typing import List
 import disnake
 
 
+class PageSource:
+    """Provides the pages of a :class:`Paginator` on demand."""
+
+    page_count: int
+
+    async def get_page(self, index: int) -> disnake.Embed:
+        raise NotImplementedError
+
+
+class ListPageSource(PageSource):
+    """A page source over embeds that were all built up front."""
+
+    def __init__(self, embeds: List[disnake.Embed]) -> None:
+        self.embeds = embeds
+        self.page_count = len(embeds)
+
+    async def get_page(self, index: int) -> disnake.Embed:
+        return self.embeds[index]
+
+
 class Paginator(disnake.ui.View):
     message: disnake.Message
 
     def __init__(
-        self, embeds: List[disnake.Embed], author: disnake.User | disnake.Member
+        self,
+        source: PageSource | List[disnake.Embed],
+        author: disnake.User | disnake.Member,
     ) -> None:
         super().__init__()
-        self.embeds = embeds
+        if not isinstance(source, PageSource):
+            source = ListPageSource(source)
+        self.source = source
         self.author = author
 
         self.embed_index = 0
-        self.first_page.disabled = True
-        self.prev_page.disabled = True
-
-        # Sets the footer of the embeds with their respective page numbers.
-        for i, embed in enumerate(self.embeds):
-            embed.set_footer(text=f"Page {i + 1} of {len(self.embeds)}")
+        self.update_buttons()
 
     async def on_timeout(self) -> None:
         await self.message.edit(view=None)
@@ -27,21 +46,35 @@ class Paginator(disnake.ui.View):
     async def interaction_check(self, interaction: disnake.MessageInteraction) -> bool:
         return interaction.author.id == self.author.id
 
+    async def get_page(self, index: int) -> disnake.Embed:
+        """Get a page from the source, with its page number in the footer."""
+        embed = await self.source.get_page(index)
+        embed.set_footer(text=f"Page {index + 1} of {self.source.page_count}")
+        return embed
+
+    def update_buttons(self) -> None:
+        on_first_page = self.embed_index == 0
+        on_last_page = self.embed_index == self.source.page_count - 1
+        self.first_page.disabled = on_first_page
+        self.prev_page.disabled = on_first_page
+        self.next_page.disabled = on_last_page
+        self.last_page.disabled = on_last_page
+
+    async def show_page(
+        self, index: int, interaction: disnake.MessageInteraction
+    ) -> None:
+        self.embed_index = index
+        embed = await self.get_page(index)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
     @disnake.ui.button(
         emoji="⏪", custom_id="first_page_button", style=disnake.ButtonStyle.blurple
     )
     async def first_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index = 0
-        embed = self.embeds[self.embed_index]
-        embed.set_footer(text=f"Page 1 of {len(self.embeds)}")
-
-        self.first_page.disabled = True
-        self.prev_page.disabled = True
-        self.next_page.disabled = False
-        self.last_page.disabled = False
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self.show_page(0, interaction)
 
     @disnake.ui.button(
         emoji="◀", custom_id="prev_page_button", style=disnake.ButtonStyle.secondary
@@ -49,15 +82,7 @@ class Paginator(disnake.ui.View):
     async def prev_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index -= 1
-        embed = self.embeds[self.embed_index]
-
-        self.next_page.disabled = False
-        self.last_page.disabled = False
-        if self.embed_index == 0:
-            self.first_page.disabled = True
-            self.prev_page.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self.show_page(self.embed_index - 1, interaction)
 
     @disnake.ui.button(
         emoji="✖️", custom_id="remove_button", style=disnake.ButtonStyle.red
@@ -73,15 +98,7 @@ class Paginator(disnake.ui.View):
     async def next_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index += 1
-        embed = self.embeds[self.embed_index]
-
-        self.first_page.disabled = False
-        self.prev_page.disabled = False
-        if self.embed_index == len(self.embeds) - 1:
-            self.next_page.disabled = True
-            self.last_page.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self.show_page(self.embed_index + 1, interaction)
 
     @disnake.ui.button(
         emoji="⏩", custom_id="last_page_button", style=disnake.ButtonStyle.blurple
@@ -89,11 +106,4 @@ class Paginator(disnake.ui.View):
     async def last_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index = len(self.embeds) - 1
-        embed = self.embeds[self.embed_index]
-
-        self.first_page.disabled = False
-        self.prev_page.disabled = False
-        self.next_page.disabled = True
-        self.last_page.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self.show_page(self.source.page_count - 1, interaction)
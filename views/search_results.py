@@ -0,0 +1,131 @@
+import math
+from typing import TYPE_CHECKING, List
+
+import disnake
+
+import utils
+from database import SearchHit
+from .paginator import PageSource
+
+if TYPE_CHECKING:
+    from bot import SauronBot
+
+
+class SearchResultsSource(PageSource):
+    """Lazily fetches the records of search results, one page at a time.
+
+    Only the identifiers of the matching records are held in memory, since
+    they come from the hash index or a ranked text query. Every page is
+    fetched by a query filtered to those identifiers (`id = ANY(...)`) and
+    ordered by `(timestamp, id)`. Since the identifiers aren't in that order,
+    every query reads and sorts all of the matching rows, which is bounded
+    by `SEARCH_RESULT_LIMIT` for text searches. A page next to one that was
+    already shown is filtered by that page's first or last `(timestamp, id)`
+    rather than skipped to with an offset, so pages stay consistent when
+    records are deleted in between.
+    """
+
+    def __init__(
+        self,
+        bot: "SauronBot",
+        record_ids: List[int],
+        image_url: str | None = None,
+        per_page: int = 10,
+    ) -> None:
+        self.bot = bot
+        self.record_ids = record_ids
+        self.image_url = image_url
+        self.per_page = per_page
+        self.page_count = max(1, math.ceil(len(record_ids) / per_page))
+
+        # The (timestamp, id) of the first and last record of each fetched page
+        self._bounds: dict[int, tuple[tuple, tuple]] = {}
+
+    async def get_page(self, index: int) -> disnake.Embed:
+        if index - 1 in self._bounds:
+            records = await self._fetch_after(self._bounds[index - 1][1])
+        elif index + 1 in self._bounds:
+            records = await self._fetch_before(self._bounds[index + 1][0])
+        elif index == self.page_count - 1 and index > 0:
+            remainder = len(self.record_ids) - index * self.per_page
+            records = await self._fetch_before(None, limit=remainder)
+        else:
+            records = await self._fetch_offset(index * self.per_page)
+
+        if records:
+            self._bounds[index] = (
+                (records[0].timestamp, records[0].id),
+                (records[-1].timestamp, records[-1].id),
+            )
+        return self.format_page(index, records)
+
+    async def _fetch_offset(self, offset: int) -> List[SearchHit]:
+        query = f"""
+            SELECT {SearchHit.COLUMNS}
+            FROM media_fingerprints
+            WHERE id = ANY($1::int[])
+            ORDER BY timestamp, id
+            OFFSET $2
+            LIMIT $3;
+        """
+        return await self.bot.fetch_records(
+            SearchHit, query, self.record_ids, offset, self.per_page
+        )
+
+    async def _fetch_after(self, key: tuple) -> List[SearchHit]:
+        query = f"""
+            SELECT {SearchHit.COLUMNS}
+            FROM media_fingerprints
+            WHERE id = ANY($1::int[])
+            AND (timestamp, id) > ($2, $3)
+            ORDER BY timestamp, id
+            LIMIT $4;
+        """
+        return await self.bot.fetch_records(
+            SearchHit, query, self.record_ids, *key, self.per_page
+        )
+
+    async def _fetch_before(
+        self, key: tuple | None, limit: int | None = None
+    ) -> List[SearchHit]:
+        # Walk backwards from the key (or the end), then restore the order
+        query = f"""
+            SELECT {SearchHit.COLUMNS}
+            FROM media_fingerprints
+            WHERE id = ANY($1::int[])
+            AND ($2::timestamptz IS NULL OR (timestamp, id) < ($2, $3::int))
+            ORDER BY timestamp DESC, id DESC
+            LIMIT $4;
+        """
+        key = key or (None, None)
+        records = await self.bot.fetch_records(
+            SearchHit, query, self.record_ids, *key, limit or self.per_page
+        )
+        return records[::-1]
+
+    def format_page(self, index: int, records: List[SearchHit]) -> disnake.Embed:
+        message_urls = []
+        for i, match in enumerate(records, index * self.per_page + 1):
+            user_mention = f"<@{match.author_id}>"
+            if match.by_bot:
+                user_mention += f" via <@{match.bot_id}>"
+            time_sent = f"<t:{int(match.timestamp.timestamp())}:F>"
+            if utils.is_image_content_type(match.content_type):
+                content_type_emoji = "🖼️"
+            elif utils.is_video_content_type(match.content_type):
+                content_type_emoji = "🎞️"
+            else:
+                content_type_emoji = "❓"
+
+            message_urls.append(
+                f"{i}. {match.jump_url} ({time_sent})\n  - Author: {user_mention}\n  - ID: {match.id} | Type: {content_type_emoji}"
+            )
+
+        embed = disnake.Embed(
+            title="Search Results",
+            description="\n".join(message_urls) or "No more results.",
+            color=disnake.Color.dark_orange(),
+        )
+        if self.image_url:
+            embed.set_thumbnail(url=self.image_url)
+        return embed
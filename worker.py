@@ -0,0 +1,50 @@
+import os
+import socket
+import asyncio
+
+from loguru import logger
+
+from bot import SauronBot
+from helpers import IngestionWorker
+from launcher import load_config
+
+
+async def main():
+    # Create config
+    config = load_config()
+
+    # Create logging file
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    logger.add(
+        f"logs/sauron-worker-{name}.log",
+        level="DEBUG" if config.DEBUG else "INFO",
+        rotation="12:00",
+    )
+
+    # The bot is only used for its ingestion methods, it never connects to
+    # the gateway
+    bot = SauronBot(config=config, temp_dir_name=f"tmp-sauron-worker-{name}")
+    await bot.setup_ingestion()
+    bot.report_startup_timings()
+
+    worker = IngestionWorker(
+        bot,
+        name,
+        concurrency=config.INGESTION_WORKER_CONCURRENCY,
+        caps={
+            "catch_up": config.CATCH_UP_MAX_IN_FLIGHT,
+            "scrub": config.SCRUB_MAX_IN_FLIGHT,
+        },
+        max_attempts=config.INGESTION_MAX_ATTEMPTS,
+        lock_timeout=config.INGESTION_LOCK_TIMEOUT,
+    )
+    try:
+        await worker.run()
+    finally:
+        await bot.close()
+
+
+# The guard is required because the analysis process pool spawns workers that
+# re-import this module.
+if __name__ == "__main__":
+    asyncio.run(main())